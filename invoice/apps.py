@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class InvoiceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'invoice'
+
+    def ready(self):
+        # Registered only; clients connect on their first query
+        from . import mongo
+        mongo.register_connections()
+
+        # Connects the role cache invalidation signals
+        from . import roles  # noqa: F401
+
+        # Load the fallback-logo fonts once per process instead of per request
+        from . import logos
+        logos.preload_fonts()
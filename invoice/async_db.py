@@ -0,0 +1,128 @@
+"""Async MongoDB access for the ASGI read views (see invoice.async_views).
+
+Uses PyMongo's native asyncio client. One client, and so one connection
+pool, is kept per event loop and shared by every request that loop serves;
+it takes its pool settings from invoice.mongo, and ``reads=True`` queries
+prefer secondaries like the sync ``for_reads`` alias does.
+Queries are still built as mongoengine querysets; their filter, ordering,
+limit and projection are sent through the async client as an aggregation,
+and the results are hydrated with ``Document._from_son``.
+"""
+import asyncio
+import weakref
+
+from django.conf import settings
+from gridfs import AsyncGridFSBucket
+from gridfs.errors import NoFile
+from pymongo import AsyncMongoClient, ReadPreference
+
+from . import mongo
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = AsyncMongoClient(
+            settings.MONGODB_HOST, settings.MONGODB_PORT, **mongo.client_options('async'),
+        )
+    return client
+
+
+def get_database():
+    return get_client()[settings.MONGODB_NAME]
+
+
+def collection(document, reads=False):
+    collection = get_database()[document._get_collection_name()]
+    if reads:
+        return collection.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+    return collection
+
+
+def _split_text(query):
+    # $text is only allowed in the pipeline's first $match, so the search_text()
+    # clause is lifted out of the query (top level or one of its $and terms)
+    query = dict(query)
+    text = query.pop('$text', None)
+    if text is None and '$and' in query:
+        terms = []
+        for term in query['$and']:
+            if text is None and '$text' in term:
+                term = dict(term)
+                text = term.pop('$text')
+            if term:
+                terms.append(term)
+        query['$and'] = terms
+        if not terms:
+            del query['$and']
+    return text, query
+
+
+def pipeline(queryset, limit=None, join=None):
+    """The aggregation equivalent of ``queryset``.
+
+    ``join`` maps reference fields to the document they point at; each is
+    resolved with a ``$lookup`` into ``_<field>`` so the referenced document
+    arrives in the same round trip.
+    """
+    stages = []
+    query = queryset._query
+    if queryset._search_text:
+        text, query = _split_text(query)
+        stages.append({'$match': {'$text': text or {'$search': queryset._search_text}}})
+    if query or not stages:
+        stages.append({'$match': query})
+    if queryset._ordering:
+        stages.append({'$sort': dict(queryset._ordering)})
+    limit = limit or queryset._limit
+    if limit:
+        stages.append({'$limit': limit})
+    projection = queryset._loaded_fields.as_dict()
+    if projection:
+        stages.append({'$project': projection})
+    for field, document in (join or {}).items():
+        stages.append({'$lookup': {
+            'from': document._get_collection_name(),
+            'localField': field,
+            'foreignField': '_id',
+            'as': f'_{field}',
+        }})
+    return stages
+
+
+async def fetch(queryset, limit=None, join=None, reads=False):
+    """Evaluate ``queryset`` on the async client, returning documents."""
+    join = join or {}
+    document = queryset._document
+    cursor = await collection(document, reads).aggregate(pipeline(queryset, limit, join))
+    results = []
+    async for son in cursor:
+        joined = {field: son.pop(f'_{field}', None) for field in join}
+        obj = document._from_son(son)
+        for field, related in join.items():
+            if joined[field]:
+                # Attached the way prefetch_vendors does, so templates never dereference
+                obj._data[field] = related._from_son(joined[field][0])
+        results.append(obj)
+    return results
+
+
+async def first(queryset, join=None):
+    results = await fetch(queryset, limit=1, join=join)
+    return results[0] if results else None
+
+
+async def estimated_count(document, reads=False):
+    return await collection(document, reads).estimated_document_count()
+
+
+async def read_file(file_id, bucket='images'):
+    """``(bytes, content_type)`` of a GridFS file, or ``(None, None)``."""
+    try:
+        grid_out = await AsyncGridFSBucket(get_database(), bucket_name=bucket).open_download_stream(file_id)
+    except NoFile:
+        return None, None
+    return await grid_out.read(), grid_out.content_type
@@ -0,0 +1,103 @@
+"""Async versions of the read-heavy views, for deployments served over ASGI.
+
+urls.py routes to these instead of their invoice.views counterparts when
+INVOICE_ASYNC_VIEWS is on. Documents are read through invoice.async_db: the
+vendor is joined into the same aggregation as the document, and the client
+settings load concurrently with it, so a request neither blocks the event
+loop on pymongo nor hops to a thread to query Mongo.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect, render
+
+from . import async_db, rendering, views
+from .decorators import roles_required
+from .filters import filter_documents, filter_query
+from .models import Client, Invoice, PurchaseOrder, Vendor
+from .pagination import InvalidCursor, KeysetPaginator
+
+WITH_VENDOR = {'vendor': Vendor}
+
+
+async def _page(queryset, date_field, request, filtered):
+    paginator = KeysetPaginator(queryset, date_field, per_page=views.LIST_PAGE_SIZE, approximate_count=not filtered)
+    cursor = request.GET.get('cursor')
+    try:
+        direction, window = paginator.window(cursor)
+    except InvalidCursor:
+        cursor = None
+        direction, window = paginator.window()
+
+    fetches = [async_db.fetch(window, paginator.per_page + 1, join=WITH_VENDOR, reads=True)]
+    if paginator.approximate_count:
+        fetches.append(async_db.estimated_count(queryset._document, reads=True))
+    rows, *count = await asyncio.gather(*fetches)
+    return paginator.build_page(rows, direction, has_cursor=bool(cursor), count=count[0] if count else None)
+
+
+async def _get(queryset, pk, join=None):
+    try:
+        pk = ObjectId(pk)
+    except (InvalidId, TypeError):
+        return None
+    return await async_db.first(queryset.filter(pk=pk), join=join)
+
+
+async def _ensure_list_totals(invoices):
+    # As views.ensure_list_totals: items for invoices with outdated stored totals
+    stale = {invoice.pk: invoice for invoice in invoices if invoice.totals_stale}
+    if stale:
+        for found in await async_db.fetch(Invoice.objects(pk__in=list(stale)).only('items'), reads=True):
+            stale[found.pk].items = found.items
+            stale[found.pk].ensure_totals()
+
+
+@roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
+async def invoice_list(request):
+    queryset, filtered = filter_documents(Invoice.objects.exclude('items'), 'invoice_date', request.GET)
+    invoices = await _page(queryset, 'invoice_date', request, filtered)
+    await _ensure_list_totals(invoices.object_list)
+    return render(request, 'invoice_list.html', {'invoices': invoices, 'filter_query': filter_query(request.GET)})
+
+
+@roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
+async def invoice_detail(request, pk):
+    invoice, client = await asyncio.gather(_get(Invoice.objects, pk, join=WITH_VENDOR), Client.aload())
+    if invoice is None:
+        return redirect('invoice_list')
+    return HttpResponse(await rendering.arender_invoice('invoice_detail.html', invoice, client))
+
+
+@roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
+async def po_list(request):
+    queryset, filtered = filter_documents(PurchaseOrder.objects.all(), 'po_date', request.GET)
+    purchase_orders = await _page(queryset, 'po_date', request, filtered)
+    return render(request, 'po_list.html', {'purchase_orders': purchase_orders, 'filter_query': filter_query(request.GET)})
+
+
+@roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
+async def po_detail(request, pk):
+    po, logo_src = await asyncio.gather(_get(PurchaseOrder.objects, pk, join=WITH_VENDOR), Client.aload_logo_data_uri())
+    if po is None:
+        return redirect('po_list')
+    client = await Client.aload()  # Cached by aload_logo_data_uri
+    return render(request, 'po_detail.html', {'po': po, 'client': client, 'logo_src': logo_src})
+
+
+async def vendor_logo(request, pk):
+    vendor = await _get(Vendor.objects.only('name', 'logo'), pk)
+    if vendor is None:
+        raise Http404("Vendor not found")
+    if vendor.logo and vendor.logo.grid_id:
+        # Uploaded logos and their thumbnails are streamed from GridFS with
+        # Range support, which the sync driver does; run it in a worker thread
+        response = await sync_to_async(views.uploaded_logo_response)(request, vendor)
+        if response is not None:
+            return response
+    # Drawing the logo with Pillow and its disk cache would block the event
+    # loop; it touches no database, so it needn't wait for the shared thread
+    return await sync_to_async(views.generated_logo_response, thread_sensitive=False)(request, vendor.initials)
@@ -0,0 +1,856 @@
+"""Benchmarks for the views and model hot paths, run by ``run_benchmarks``.
+
+Each benchmark is one operation (usually a request through the full
+middleware stack with Django's test client) timed over several runs after a
+warmup. Every run is wrapped in :func:`~invoice.instrumentation.capture_queries`,
+so the report also records how many Mongo commands and SQL queries it
+takes; benchmarks marked ``memory`` get one more run under tracemalloc for
+their peak allocation. The scaling benchmarks run an export or ledger at
+two sizes and fail if its peak memory grows with the size, and
+``po_pdf.workers`` fails unless PDF throughput rises with the worker count.
+
+:func:`compare` checks a report against a stored baseline. Timings and
+memory may grow by ``tolerance`` (plus a small absolute noise floor);
+query counts are deterministic and may not grow at all.
+
+The data comes from the database the app is configured for, normally
+filled by ``seed_data``. Benchmarks that need something the database or
+environment lacks (no invoices, WeasyPrint not installed) are reported as
+skipped rather than failing the run.
+"""
+import csv
+import io
+import os
+import platform
+import random
+import secrets
+import statistics
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from functools import cached_property
+from unittest import mock
+
+import django
+import pymongo
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.template.loader import render_to_string
+from django.test import AsyncClient, Client as TestClient, override_settings
+from django.urls import URLPattern, reverse
+
+from . import async_views, exports, importers, ledgers, mongo, pdf, rendering, rollups, seeding, sequences, totals, urls, views
+from .instrumentation import capture_queries
+from .models import Client, Invoice, InvoiceItem, PurchaseOrder, Vendor, ensure_profile, last_issued_number
+from .pagination import encode_cursor
+from .prefetch import prefetch_vendors
+
+DEFAULT_REPEAT = 20
+DEFAULT_WARMUP = 3
+DEFAULT_TOLERANCE = 0.25
+# Timing differences below this are noise, whatever the tolerance
+NOISE_FLOOR_MS = 2.0
+NOISE_FLOOR_KB = 256
+
+# The list views' page size, and how deep the deep-page benchmarks go: the
+# page keyset pagination is meant to keep flat, or the last page of a smaller
+# dataset. The .offset variants page to the same depth with skip() to compare.
+PER_PAGE = views.LIST_PAGE_SIZE
+DEEP_PAGE = 5000
+
+IMPORT_INVOICES = 200
+IMPORT_TERMS = 'Benchmark import'
+
+# The benchmarks write to the database (users, imported invoices, counters),
+# so they only run against one whose name marks it as disposable, unless
+# the database is named explicitly (run_benchmarks --database)
+SCRATCH_DATABASE_PREFIXES = ('test_', 'bench')
+
+BENCHMARKS = {}
+
+
+class Skip(Exception):
+    """The benchmark can't run against this database or environment."""
+
+
+class UnsafeDatabase(Exception):
+    """The configured database is not a scratch database."""
+
+
+def check_database(name):
+    if not name.startswith(SCRATCH_DATABASE_PREFIXES):
+        raise UnsafeDatabase(
+            f"refusing to benchmark {name!r}: the benchmarks write to the database, so its name must start "
+            f"with {' or '.join(SCRATCH_DATABASE_PREFIXES)}, or be named explicitly with --database"
+        )
+
+
+class Benchmark:
+    def __init__(self, name, func, repeat=None, memory=False, teardown=None, urlconf=None, warmup=None):
+        self.name = name
+        self.func = func
+        self.repeat = repeat
+        self.warmup = warmup
+        self.memory = memory
+        self.teardown = teardown
+        self.urlconf = urlconf
+
+
+def benchmark(name, repeat=None, memory=False, teardown=None, urlconf=None, warmup=None):
+    """Register ``func(ctx)`` as one run of benchmark ``name``.
+
+    It may return a dict of extra metrics (e.g. rows per second), which are
+    added to the result from its last run. ``teardown(ctx)`` runs after each
+    run, outside the timing, and ``urlconf`` replaces ROOT_URLCONF for all
+    of its runs. ``repeat`` and ``warmup`` override the run's defaults.
+    """
+    def register(func):
+        BENCHMARKS[name] = Benchmark(name, func, repeat, memory, teardown, urlconf, warmup)
+        return func
+    return register
+
+
+# ROOT_URLCONF for the .async benchmarks: the app's URLs, with the read
+# views swapped for their async versions as INVOICE_ASYNC_VIEWS would
+ASYNC_READ_VIEWS = ('invoice_list', 'invoice_detail', 'po_list', 'po_detail', 'vendor_logo')
+urlpatterns = [
+    URLPattern(
+        pattern.pattern,
+        getattr(async_views, pattern.name) if pattern.name in ASYNC_READ_VIEWS else pattern.callback,
+        pattern.default_args,
+        pattern.name,
+    )
+    for pattern in urls.urlpatterns
+]
+
+
+def consume(response):
+    """Read a response to the end; returns its size in bytes."""
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Context:
+    """What the benchmarks run against: a logged-in client and sample documents."""
+
+    def __init__(self):
+        self.user, self._created_user = User.objects.get_or_create(username=f'{seeding.USER_PREFIX}admin')
+        profile = ensure_profile(self.user)
+        self._previous_role = profile.role
+        if profile.role != 'admin':
+            profile.role = 'admin'
+            profile.save()
+        self.client = TestClient()
+        self.client.force_login(self.user)
+        self.async_client = AsyncClient()
+        self.async_client.cookies = self.client.cookies
+
+    def close(self):
+        User.objects.filter(username=f'{seeding.USER_PREFIX}login').delete()
+        if self._created_user:
+            self.user.delete()
+        elif self._previous_role != 'admin':
+            profile = ensure_profile(self.user)
+            profile.role = self._previous_role
+            profile.save()
+
+    def get(self, name, *args, expect=(200,), headers=None, **params):
+        response = self.client.get(reverse(name, args=args), params, headers=headers)
+        return self._check(name, response, expect)
+
+    def post(self, name, data, expect=(200,)):
+        return self._check(name, self.client.post(reverse(name), data), expect)
+
+    def aget(self, name, *args, expect=(200,), **params):
+        response = async_to_sync(self.async_client.get)(reverse(name, args=args), params)
+        return self._check(name, response, expect)
+
+    @staticmethod
+    def _check(name, response, expect):
+        if response.status_code not in expect:
+            raise AssertionError(f"{name} returned {response.status_code}, expected {expect}")
+        response.size = consume(response)
+        return response
+
+    @staticmethod
+    def _require(value, what):
+        if not value:
+            raise Skip(f"no {what} in the database; run seed_data first")
+        return value
+
+    @cached_property
+    def invoice(self):
+        return self._require(Invoice.objects.order_by('-invoice_date').only('id').first(), 'invoices')
+
+    @cached_property
+    def invoice_print_key(self):
+        return rendering.cache_key('invoice_print.html', Invoice.objects.get(pk=self.invoice.pk), Client.load_logo_data_uri())
+
+    @cached_property
+    def purchase_order(self):
+        return self._require(PurchaseOrder.objects.order_by('-po_date').only('id').first(), 'purchase orders')
+
+    @cached_property
+    def vendor(self):
+        return self._require(Vendor.objects.only('id', 'name').first(), 'vendors')
+
+    def deep_page(self, document, date_field):
+        """``(page, cursor)`` for the deepest page up to DEEP_PAGE."""
+        pages = -(-document.objects.count() // PER_PAGE)
+        if pages < 2:
+            raise Skip(f"fewer than 2 pages of {document._meta['collection']}; run seed_data first")
+        page = min(DEEP_PAGE, pages)
+        # The last row of the page before it
+        last = document.objects.order_by(f'-{date_field}', '-id').skip((page - 1) * PER_PAGE - 1).only(date_field).first()
+        return page, encode_cursor('next', getattr(last, date_field), last.pk)
+
+    @cached_property
+    def invoice_deep_page(self):
+        return self.deep_page(Invoice, 'invoice_date')
+
+    @cached_property
+    def po_deep_page(self):
+        return self.deep_page(PurchaseOrder, 'po_date')
+
+    @cached_property
+    def export_invoice_ids(self):
+        ids = Invoice.objects.order_by('-invoice_date').limit(settings.EXPORT_SYNC_LIMIT).scalar('id')
+        return [str(pk) for pk in self._require(list(ids), 'invoices')]
+
+    @cached_property
+    def export_po_ids(self):
+        ids = PurchaseOrder.objects.order_by('-po_date').limit(settings.EXPORT_SYNC_LIMIT).scalar('id')
+        return [str(pk) for pk in self._require(list(ids), 'purchase orders')]
+
+    @cached_property
+    def pdf_jobs(self):
+        # render_many jobs for PDF_SCALING_DOCUMENTS purchase orders, as the PO export builds them
+        purchase_orders = PurchaseOrder.objects.limit(PDF_SCALING_DOCUMENTS)
+        purchase_orders = self._require(list(prefetch_vendors(purchase_orders)), 'purchase orders')
+        client, logo_src = Client.load(), Client.load_logo_data_uri()
+        jobs = [
+            (po.po_number, render_to_string('po_detail.html', {'po': po, 'client': client, 'logo_src': logo_src}), None)
+            for po in purchase_orders
+        ]
+        return [jobs[number % len(jobs)] for number in range(PDF_SCALING_DOCUMENTS)]
+
+    @cached_property
+    def search_term(self):
+        return self.vendor.name.split()[0][:4]
+
+    @cached_property
+    def logo_etag(self):
+        return self.get('vendor_logo', self.vendor.pk)['ETag']
+
+    @cached_property
+    def login_password(self):
+        password = secrets.token_urlsafe(16)
+        user, _ = User.objects.get_or_create(username=f'{seeding.USER_PREFIX}login')
+        user.set_password(password)
+        user.save()
+        ensure_profile(user)
+        return password
+
+    @cached_property
+    def totals_items(self):
+        return [
+            InvoiceItem(description='Item', quantity=number % 7 + 1, unit_price=19.99 * number, discount=number % 3,
+                        tax=number % 2 == 0)
+            for number in range(1, 101)
+        ]
+
+    @cached_property
+    def totals_batch(self):
+        # In memory only: the batch benchmarks time the arithmetic, not Mongo
+        rng = random.Random(0)
+        return [
+            Invoice(items=[
+                InvoiceItem(description='Item', quantity=rng.randint(1, 50), unit_price=round(rng.uniform(5, 5000), 2),
+                            discount=rng.choice([0, 0, round(rng.uniform(0, 200), 2)]), tax=rng.random() < 0.6)
+                for _ in range(rng.randint(1, 40))
+            ])
+            for _ in range(TOTALS_BATCH_INVOICES)
+        ]
+
+    @cached_property
+    def totals_batch_chain(self):
+        return [_property_chain_totals(invoice) for invoice in self.totals_batch]
+
+    @cached_property
+    def import_vendors(self):
+        # Seeded vendors only: the import takes numbers from their counters
+        return self._require(list(seeding.seeded_vendors().only('name').limit(20)), 'seeded vendors')
+
+    @cached_property
+    def import_csv(self):
+        vendors = [vendor.name for vendor in self.import_vendors]
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['reference', 'vendor', 'invoice_date', 'terms', 'description', 'quantity', 'unit_price', 'tax'])
+        for number in range(IMPORT_INVOICES):
+            for line in range(3):
+                writer.writerow([
+                    f'bench-{number}', vendors[number % len(vendors)], date.today().isoformat(), IMPORT_TERMS,
+                    f'Line {line}', line + 1, '125.50', 'yes' if line % 2 else '',
+                ])
+        return output.getvalue()
+
+
+# --- Lists ---
+
+@benchmark('invoice_list')
+def bench_invoice_list(ctx):
+    ctx.get('invoice_list')
+
+
+def _offset_page(queryset, date_field, page):
+    # How the lists paged before keyset pagination: skip every earlier row
+    return list(mongo.for_reads(queryset).order_by(f'-{date_field}', '-id').skip((page - 1) * PER_PAGE).limit(PER_PAGE))
+
+
+@benchmark('invoice_list.deep_page')
+def bench_invoice_list_deep(ctx):
+    page, cursor = ctx.invoice_deep_page
+    ctx.get('invoice_list', cursor=cursor)
+    return {'page': page}
+
+
+@benchmark('invoice_list.deep_page.offset')
+def bench_invoice_list_deep_offset(ctx):
+    page, _ = ctx.invoice_deep_page
+    _offset_page(Invoice.objects.exclude('items'), 'invoice_date', page)
+    return {'page': page}
+
+
+@benchmark('invoice_list.search')
+def bench_invoice_list_search(ctx):
+    ctx.get('invoice_list', q=ctx.search_term)
+
+
+@benchmark('invoice_list.date_range')
+def bench_invoice_list_dates(ctx):
+    ctx.get('invoice_list', start=(date.today() - timedelta(days=90)).isoformat(), end=date.today().isoformat())
+
+
+@benchmark('invoice_list.async', urlconf=__name__)
+def bench_invoice_list_async(ctx):
+    ctx.aget('invoice_list')
+
+
+@benchmark('po_list')
+def bench_po_list(ctx):
+    ctx.get('po_list')
+
+
+@benchmark('po_list.deep_page')
+def bench_po_list_deep(ctx):
+    page, cursor = ctx.po_deep_page
+    ctx.get('po_list', cursor=cursor)
+    return {'page': page}
+
+
+@benchmark('po_list.deep_page.offset')
+def bench_po_list_deep_offset(ctx):
+    page, _ = ctx.po_deep_page
+    _offset_page(PurchaseOrder.objects.all(), 'po_date', page)
+    return {'page': page}
+
+
+@benchmark('po_list.async', urlconf=__name__)
+def bench_po_list_async(ctx):
+    ctx.aget('po_list')
+
+
+@benchmark('vendor_list')
+def bench_vendor_list(ctx):
+    ctx.get('vendor_list')
+
+
+@benchmark('home.dashboard')
+def bench_home(ctx):
+    ctx.get('home')
+
+
+# --- Documents ---
+
+@benchmark('invoice_detail')
+def bench_invoice_detail(ctx):
+    ctx.get('invoice_detail', ctx.invoice.pk)
+
+
+@benchmark('invoice_detail.async', urlconf=__name__)
+def bench_invoice_detail_async(ctx):
+    ctx.aget('invoice_detail', ctx.invoice.pk)
+
+
+@benchmark('invoice_print_preview')
+def bench_invoice_print(ctx):
+    ctx.get('invoice_print_preview', ctx.invoice.pk)
+
+
+@benchmark('invoice_print_preview.uncached')
+def bench_invoice_print_uncached(ctx):
+    # The timed runs above are served from the render cache after the warmup
+    cache.delete(ctx.invoice_print_key)
+    ctx.get('invoice_print_preview', ctx.invoice.pk)
+
+
+@benchmark('po_detail')
+def bench_po_detail(ctx):
+    ctx.get('po_detail', ctx.purchase_order.pk)
+
+
+@benchmark('po_download', repeat=5)
+def bench_po_download(ctx):
+    try:
+        ctx.get('po_download', ctx.purchase_order.pk)
+    except ImportError as e:
+        raise Skip(f"PDF backend unavailable: {e}")
+
+
+@benchmark('vendor_logo')
+def bench_vendor_logo(ctx):
+    ctx.get('vendor_logo', ctx.vendor.pk)
+
+
+@benchmark('vendor_logo.not_modified')
+def bench_vendor_logo_304(ctx):
+    ctx.get('vendor_logo', ctx.vendor.pk, expect=(304,), headers={'If-None-Match': ctx.logo_etag})
+
+
+# --- Exports and reports ---
+
+@benchmark('invoice_bulk_download', repeat=5, memory=True)
+def bench_invoice_bulk_download(ctx):
+    response = ctx.post('invoice_bulk_download', {'invoice_ids': ctx.export_invoice_ids})
+    return {'documents': len(ctx.export_invoice_ids), 'bytes': response.size}
+
+
+@benchmark('po_bulk_download', repeat=3, memory=True)
+def bench_po_bulk_download(ctx):
+    try:
+        ctx.post('po_bulk_download', {'po_ids': ctx.export_po_ids})
+    except ImportError as e:
+        raise Skip(f"PDF backend unavailable: {e}")
+    return {'documents': len(ctx.export_po_ids)}
+
+
+@benchmark('invoice_ledger', repeat=3, memory=True)
+def bench_invoice_ledger(ctx):
+    started = time.perf_counter()
+    response = ctx.client.get(reverse('invoice_ledger'))
+    rows = sum(chunk.count(b'\n') for chunk in response.streaming_content) - 1
+    return {'rows': rows, 'rows_per_second': round(rows / (time.perf_counter() - started), 1)}
+
+
+@benchmark('report_revenue.month', repeat=5)
+def bench_report_month(ctx):
+    ctx.get('report_revenue_json', period='month')
+
+
+@benchmark('report_revenue.day', repeat=5)
+def bench_report_day(ctx):
+    ctx.get('report_revenue_json', period='day')
+
+
+def _delete_imported(ctx):
+    imported = Invoice.objects(terms=IMPORT_TERMS)
+    # A queryset delete skips Invoice.delete(), so take the invoices out of the rollups here
+    rollups.record([
+        contribution
+        for son in imported.only(*rollups.INVOICE_FIELDS).as_pymongo()
+        for contribution in rollups.invoice_contributions(son)
+    ], [])
+    imported.delete()
+    # Hand the numbers back, so repeated runs leave no gaps in the sequences
+    year = date.today().year
+    for key in {sequences.sequence_key('INV', vendor.initials, year) for vendor in ctx.import_vendors}:
+        sequences.Counter.objects(id=key).update(set__seq=last_issued_number(Invoice, 'invoice_number', key))
+
+
+@benchmark('importer', repeat=3, teardown=_delete_imported)
+def bench_importer(ctx):
+    result = importers.import_invoices(io.StringIO(ctx.import_csv), 'csv')
+    if result.errors:
+        raise AssertionError(f"import failed: {result.errors[:3]}")
+    return {'rows': result.rows, 'rows_per_second': round(result.rows_per_second, 1)}
+
+
+# --- Scaling ---
+#
+# These run one operation at two or more sizes and fail if it doesn't scale
+# the way it should: a streaming export's or ledger's memory has to stay
+# flat as it grows, and PDF throughput has to rise with the worker count. They run once with no warmup, smallest size first, so the
+# RSS a larger size adds is not hidden by an earlier, larger run.
+
+EXPORT_SCALING_DOCUMENTS = 2000
+# zipfile keeps each entry's central directory record (a few hundred bytes)
+# until the archive is closed; the entries themselves must not stay behind
+EXPORT_ENTRY_KB = 1
+# Peak RSS growth below this is allocator noise
+RSS_NOISE_FLOOR_KB = 4096
+
+
+def _status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(f'{field}:'):
+                return int(line.split()[1])
+
+
+def _reset_peak_rss():
+    # Linux only: writing 5 to clear_refs resets VmHWM to the current RSS
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _status_kb('VmRSS')
+    except OSError:
+        return None
+
+
+def measure_memory(func):
+    """Run ``func()``; returns its result, peak traced allocation and peak RSS growth, in KB.
+
+    The RSS growth is None where /proc can't report it.
+    """
+    rss = _reset_peak_rss()
+    tracemalloc.start()
+    try:
+        value = func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if rss is not None:
+        rss = max(0, _status_kb('VmHWM') - rss)
+    return value, round(peak / 1024), rss
+
+
+def scaling_sizes(total, largest, smallest):
+    """Sizes a scaling benchmark runs at: up to ``largest``, and an eighth of that."""
+    size = min(total, largest)
+    if size // 8 < smallest:
+        raise Skip(f"needs at least {smallest * 8} documents, found {total}; run seed_data with more")
+    return size // 8, size
+
+
+def memory_scaling(name, unit, sizes, func, per_unit_kb=0):
+    """Run ``func(size)`` for each of ``sizes``, failing unless peak memory stays flat.
+
+    ``func`` may return a dict of metrics for the size (e.g. bytes written).
+    ``per_unit_kb`` is the bookkeeping each extra unit may legitimately add.
+    """
+    # Loads templates, opens connections and fills process-wide caches
+    # before anything is measured
+    func(sizes[0])
+    runs = []
+    for size in sizes:
+        metrics, peak_kb, rss_kb = measure_memory(lambda: func(size))
+        runs.append({unit: size, **(metrics or {}), 'peak_kb': peak_kb, 'rss_kb': rss_kb})
+
+    first, last = runs[0], runs[-1]
+    allowance = per_unit_kb * (last[unit] - first[unit])
+    for metric, floor in (('peak_kb', NOISE_FLOOR_KB), ('rss_kb', RSS_NOISE_FLOOR_KB)):
+        if first[metric] is None:
+            continue
+        if last[metric] > first[metric] * (1 + DEFAULT_TOLERANCE) + floor + allowance:
+            raise AssertionError(
+                f"{name}: {metric} grew from {first[metric]} at {first[unit]} {unit} "
+                f"to {last[metric]} at {last[unit]} {unit}"
+            )
+    return {'sizes': runs}
+
+
+@benchmark('invoice_bulk_download.scaling', repeat=1, warmup=0)
+def bench_invoice_export_scaling(ctx):
+    ids = [str(pk) for pk in Invoice.objects.order_by('-invoice_date').limit(EXPORT_SCALING_DOCUMENTS).scalar('id')]
+    sizes = scaling_sizes(len(ids), EXPORT_SCALING_DOCUMENTS, exports.EXPORT_BATCH_SIZE)
+    client = Client.load()
+
+    def export(size):
+        # The archive the view streams (or the worker writes), for the first
+        # ``size`` invoices; built above EXPORT_SYNC_LIMIT the view would queue it
+        chunks = exports.stream_zip(exports.invoice_export_entries(ids[:size], client))
+        return {'bytes': sum(len(chunk) for chunk in chunks)}
+
+    # The render cache holds up to its own MAX_ENTRIES pages whatever the
+    # export size, which would count toward the smaller export only
+    with mock.patch.object(rendering, 'cache', DummyCache('benchmarks', {})):
+        return memory_scaling('invoice_bulk_download.scaling', 'documents', sizes, export, EXPORT_ENTRY_KB)
+
+
+
+@benchmark('invoice_ledger.scaling', repeat=1, warmup=0)
+def bench_invoice_ledger_scaling(ctx):
+    # Every invoice, and the oldest eighth of them: seed a large database
+    # (e.g. seed_data --invoices 200000 --items 5) for a ledger of a million lines
+    count = Invoice.objects.count()
+    sizes = scaling_sizes(count, count, ledgers.LEDGER_BATCH_SIZE)
+
+    def ledger(size):
+        chunks = ledgers.invoice_ledger(mongo.for_reads(Invoice.objects.limit(size)))
+        return {'rows': sum(chunk.count('\n') for chunk in chunks) - 1}
+
+    return memory_scaling('invoice_ledger.scaling', 'invoices', sizes, ledger)
+
+
+PDF_WORKER_COUNTS = (1, 2, 4)
+PDF_SCALING_DOCUMENTS = 32
+# Each worker past the first must add at least this share of one worker's throughput
+PDF_WORKER_EFFICIENCY = 0.5
+
+
+def _render_pdfs(engine, jobs):
+    for _, result in engine.render_many(jobs):
+        if isinstance(result, ImportError):
+            raise Skip(f"PDF backend unavailable: {result}")
+        if isinstance(result, Exception):
+            raise result
+
+
+@benchmark('po_pdf.workers', repeat=1, warmup=0)
+def bench_pdf_workers(ctx):
+    counts = [workers for workers in PDF_WORKER_COUNTS if workers <= (os.cpu_count() or 1)]
+    if len(counts) < 2:
+        raise Skip("needs at least 2 CPUs to compare worker counts")
+    jobs = ctx.pdf_jobs
+    runs = []
+    for workers in counts:
+        engine = pdf.PDFEngine(settings.INVOICE_PDF_BACKEND, workers, settings.INVOICE_PDF_TIMEOUT)
+        try:
+            # Starts the worker processes and loads the backend in each
+            _render_pdfs(engine, jobs[:workers * 2])
+            started = time.perf_counter()
+            _render_pdfs(engine, jobs)
+            elapsed = time.perf_counter() - started
+        finally:
+            engine.shutdown()
+        runs.append({'workers': workers, 'documents_per_second': round(len(jobs) / elapsed, 2)})
+
+    single = runs[0]['documents_per_second']
+    for run in runs[1:]:
+        expected = single * (1 + PDF_WORKER_EFFICIENCY * (run['workers'] - 1))
+        if run['documents_per_second'] < expected:
+            raise AssertionError(
+                f"po_pdf.workers: {run['workers']} workers render {run['documents_per_second']} documents/s, "
+                f"expected at least {expected:.2f} from {single} with one worker"
+            )
+    return {'sizes': runs}
+
+# --- Model hot paths ---
+
+NUMBERING_THREADS = 8
+NUMBERING_PER_THREAD = 50
+NUMBERING_KEY = sequences.sequence_key('BENCH', 'NUM', 0)
+
+
+def _reset_numbering(ctx):
+    sequences.Counter.objects(id=NUMBERING_KEY).delete()
+
+
+@benchmark('numbering.concurrent', repeat=5, teardown=_reset_numbering)
+def bench_numbering(ctx):
+    issued = []
+
+    def take():
+        numbers = [sequences.next_value(NUMBERING_KEY) for _ in range(NUMBERING_PER_THREAD)]
+        issued.extend(numbers)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=take) for _ in range(NUMBERING_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if len(set(issued)) != NUMBERING_THREADS * NUMBERING_PER_THREAD:
+        raise AssertionError("concurrent numbering issued duplicate numbers")
+    return {'numbers_per_second': round(len(issued) / elapsed, 1)}
+
+
+@benchmark('totals.invoice_100_items')
+def bench_totals(ctx):
+    Invoice(items=ctx.totals_items).compute_totals()
+
+
+@benchmark('totals.item_properties')
+def bench_item_properties(ctx):
+    for item in ctx.totals_items:
+        item.amount, item.tax_amount, item.net_amount
+
+
+TOTALS_BATCH_INVOICES = 1000
+
+
+def _property_chain_totals(invoice):
+    # Invoice totals as the model computed them before invoice.totals: one
+    # walk of the items per property, and total re-summing sub_total
+    sub_total = lambda: sum(item.net_amount for item in invoice.items)
+    discount_total = sum(float(item.discount) for item in invoice.items)
+    tax_total = sum(item.tax_amount for item in invoice.items)
+    return {
+        'sub_total': sub_total(),
+        'discount_total': discount_total,
+        'tax_total': tax_total,
+        'total': sub_total() - discount_total + tax_total,
+    }
+
+
+@benchmark('totals.batch.property_chain')
+def bench_totals_chain(ctx):
+    started = time.perf_counter()
+    for invoice in ctx.totals_batch:
+        _property_chain_totals(invoice)
+    return {'invoices_per_second': round(len(ctx.totals_batch) / (time.perf_counter() - started))}
+
+
+@benchmark('totals.batch.numpy')
+def bench_totals_numpy(ctx):
+    if totals.np is None:
+        raise Skip("NumPy is not installed")
+    expected = ctx.totals_batch_chain
+    started = time.perf_counter()
+    figures = totals.batch_invoice_totals(ctx.totals_batch)
+    elapsed = time.perf_counter() - started
+    for batch_figures, chain in zip(figures, expected):
+        if any(abs(batch_figures[field] - chain[field]) > 1e-6 * max(1, abs(chain[field])) for field in chain):
+            raise AssertionError(f"batch totals differ from the property chain: {batch_figures} != {chain}")
+    return {'invoices_per_second': round(len(figures) / elapsed)}
+
+
+@benchmark('totals.batch.exact')
+def bench_totals_exact(ctx):
+    started = time.perf_counter()
+    totals.batch_invoice_totals(ctx.totals_batch, exact=True)
+    return {'invoices_per_second': round(len(ctx.totals_batch) / (time.perf_counter() - started))}
+
+
+@benchmark('login', repeat=5)
+def bench_login(ctx):
+    client = TestClient()
+    response = client.post(reverse('login'), {'username': f'{seeding.USER_PREFIX}login', 'password': ctx.login_password})
+    if response.status_code != 302:
+        raise AssertionError(f"login returned {response.status_code}")
+
+
+# --- Running and comparing ---
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_one(bench, ctx, repeat, warmup):
+    if bench.urlconf:
+        with override_settings(ROOT_URLCONF=bench.urlconf):
+            return _run_one(bench, ctx, repeat, warmup)
+    return _run_one(bench, ctx, repeat, warmup)
+
+
+def _run_one(bench, ctx, repeat, warmup):
+    repeat = bench.repeat or repeat
+    warmup = warmup if bench.warmup is None else bench.warmup
+    extra = {}
+    for _ in range(min(warmup, repeat)):
+        bench.func(ctx)
+        if bench.teardown:
+            bench.teardown(ctx)
+
+    timings, mongo, sql = [], [], []
+    for _ in range(repeat):
+        with capture_queries() as log:
+            started = time.perf_counter()
+            extra = bench.func(ctx) or {}
+            timings.append((time.perf_counter() - started) * 1000)
+        mongo.append(log.mongo_count)
+        sql.append(log.sql_count)
+        if bench.teardown:
+            bench.teardown(ctx)
+
+    result = {
+        'runs': repeat,
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'p95_ms': round(_percentile(timings, 0.95), 3),
+        'mongo_queries': max(mongo),
+        'sql_queries': max(sql),
+        **extra,
+    }
+    if bench.memory:
+        tracemalloc.start()
+        try:
+            bench.func(ctx)
+            result['peak_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024)
+        finally:
+            tracemalloc.stop()
+        if bench.teardown:
+            bench.teardown(ctx)
+    return result
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'pymongo': pymongo.version,
+        'debug': settings.DEBUG,
+        'async_views': settings.INVOICE_ASYNC_VIEWS,
+        'invoices': Invoice._get_collection().estimated_document_count(),
+        'purchase_orders': PurchaseOrder._get_collection().estimated_document_count(),
+        'vendors': Vendor._get_collection().estimated_document_count(),
+    }
+
+
+def run(names=None, repeat=DEFAULT_REPEAT, warmup=DEFAULT_WARMUP, progress=None, any_database=False):
+    """Run the benchmarks whose name contains any of ``names`` (all by default); returns the report.
+
+    ``progress`` is called with each benchmark's name and result. Raises
+    :class:`UnsafeDatabase` unless MONGODB_NAME is a scratch database or
+    ``any_database`` is set.
+    """
+    if not any_database:
+        check_database(settings.MONGODB_NAME)
+    selected = [bench for name, bench in BENCHMARKS.items() if not names or any(part in name for part in names)]
+    ctx = Context()
+    results = {}
+    try:
+        for bench in selected:
+            try:
+                result = run_one(bench, ctx, repeat, warmup)
+            except Skip as e:
+                result = {'skipped': str(e)}
+            results[bench.name] = result
+            if progress:
+                progress(bench.name, result)
+    finally:
+        ctx.close()
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """``[(name, metric, baseline value, current value)]`` for every regression."""
+    regressions = []
+    for name, result in report['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base or 'skipped' in result or 'skipped' in base:
+            continue
+        if (result['median_ms'] > base['median_ms'] * (1 + tolerance)
+                and result['median_ms'] - base['median_ms'] > NOISE_FLOOR_MS):
+            regressions.append((name, 'median_ms', base['median_ms'], result['median_ms']))
+        for metric in ('mongo_queries', 'sql_queries'):
+            if result[metric] > base[metric]:
+                regressions.append((name, metric, base[metric], result[metric]))
+        if ('peak_kb' in result and 'peak_kb' in base
+                and result['peak_kb'] > base['peak_kb'] * (1 + tolerance)
+                and result['peak_kb'] - base['peak_kb'] > NOISE_FLOOR_KB):
+            regressions.append((name, 'peak_kb', base['peak_kb'], result['peak_kb']))
+    return regressions
@@ -0,0 +1,15 @@
+from django.core.files.storage import default_storage
+
+from . import roles
+
+
+def user_role(request):
+    """The signed-in user's role, profile picture URL and ``can`` permission map."""
+    if not request.user.is_authenticated:
+        return {'user_role': None, 'user_picture': '', 'can': roles.permissions(request)}
+    summary = roles.profile_summary(request.user)
+    return {
+        'user_role': summary['role'],
+        'user_picture': default_storage.url(summary['picture']) if summary['picture'] else '',
+        'can': roles.permissions(request),
+    }
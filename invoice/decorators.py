@@ -1,14 +1,34 @@
 from django.contrib.auth.decorators import user_passes_test
+from django.contrib.auth.views import redirect_to_login
 from functools import wraps
+from asgiref.sync import iscoroutinefunction
 from django.shortcuts import redirect
+from . import roles
 
 def roles_required(allowed_roles=[]):
+    # Anonymous users go to the login page and come back afterwards, so
+    # views don't need login_required as well. Roles come from the cache in
+    # invoice.roles rather than a Profile query per request.
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def _async_wrapped_view(request, *args, **kwargs):
+                user = await request.auser()
+                if not user.is_authenticated:
+                    return redirect_to_login(request.get_full_path())
+                # Resolved here so the templates' role lookups never query from the event loop
+                summary = await roles.aprofile_summary(user)
+                request.user = user
+                if summary['role'] in allowed_roles:
+                    return await view_func(request, *args, **kwargs)
+                return redirect('home')
+            return _async_wrapped_view
+
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
             if not request.user.is_authenticated:
-                return redirect('login')
-            if request.user.profile.role in allowed_roles:
+                return redirect_to_login(request.get_full_path())
+            if roles.get_role(request.user) in allowed_roles:
                 return view_func(request, *args, **kwargs)
             else:
                 return redirect('home')  # Or a custom 'unauthorized' page
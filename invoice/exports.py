@@ -0,0 +1,220 @@
+import io
+import logging
+import mimetypes
+import os
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bson import ObjectId
+from django.conf import settings
+from mongoengine.queryset.visitor import Q
+from django.template.loader import render_to_string
+
+from . import pdf, rendering
+from .models import Client, ExportJob, Invoice, PurchaseOrder
+from .prefetch import prefetch_vendors
+
+logger = logging.getLogger(__name__)
+
+# Documents fetched (and vendors prefetched) per query while exporting
+EXPORT_BATCH_SIZE = 100
+
+# How the client logo goes into exported invoices: one shared file in the
+# archive, or a data URI inlined into every HTML file.
+LOGO_SHARED = 'shared'
+LOGO_EMBED = 'embed'
+
+# Job progress is written back to Mongo after this many entries
+PROGRESS_EVERY = 10
+
+
+class _ZipSink(io.RawIOBase):
+    # zipfile writes here; stream_zip drains it after every entry. It is not
+    # seekable, so zipfile falls back to data descriptors and never rewinds.
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries, compression=zipfile.ZIP_DEFLATED):
+    """Yield a ZIP archive chunk by chunk from ``(filename, data)`` pairs.
+
+    Only the entry being written is held in memory, so the archive can be
+    fed straight into a StreamingHttpResponse.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression) as zf:
+        for filename, data in entries:
+            zf.writestr(filename, data)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    yield sink.drain()
+
+
+def fetch_in_batches(document, ids, batch_size=EXPORT_BATCH_SIZE):
+    """Yield documents for ``ids`` in the requested order, one ``$in`` query per batch."""
+    ids = [ObjectId(pk) for pk in ids if ObjectId.is_valid(pk)]
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        found = {doc.pk: doc for doc in prefetch_vendors(document.objects(pk__in=batch))}
+        for pk in batch:
+            if pk in found:
+                yield found[pk]
+
+
+def invoice_export_entries(invoice_ids, client, logo_mode=LOGO_SHARED):
+    logo, content_type = Client.load_logo()
+    logo_src = None
+    if logo and logo_mode == LOGO_SHARED:
+        # One copy in the archive, referenced by relative path from every invoice
+        logo_src = f"assets/client_logo{mimetypes.guess_extension(content_type or '') or '.png'}"
+        yield logo_src, logo
+    elif logo:
+        logo_src = Client.load_logo_data_uri()
+
+    # Invoices rendered by an earlier export, or by the print preview when the
+    # logo is embedded (or there is none), come from the cache
+    rendered = rendering.render_invoices(
+        'invoice_print.html', fetch_in_batches(Invoice, invoice_ids), client, logo_src, EXPORT_BATCH_SIZE,
+    )
+    for invoice, html_content in rendered:
+        yield f"invoice_{invoice.invoice_number.replace('/', '_')}.html", html_content
+
+
+def po_export_entries(po_ids, client, base_url, engine=None):
+    # HTML is rendered here (it needs the database); the PDF conversion runs
+    # on the engine's worker pool and entries are yielded as each finishes.
+    engine = engine or pdf.get_engine()
+    logo_src = Client.load_logo_data_uri()
+    jobs = (
+        (po.po_number, render_to_string('po_detail.html', {'po': po, 'client': client, 'logo_src': logo_src}), base_url)
+        for po in fetch_in_batches(PurchaseOrder, po_ids)
+    )
+    failures = []
+    for po_number, result in engine.render_many(jobs):
+        if isinstance(result, Exception):
+            failures.append(f"{po_number}: {result}")
+            continue
+        yield f"PO_{po_number.replace('/', '-')}.pdf", result
+    if failures:
+        yield 'errors.txt', '\n'.join(failures)
+
+
+def enqueue_export(kind, document_ids, user, base_url=None, logo_mode=None):
+    return ExportJob(
+        kind=kind,
+        document_ids=list(document_ids),
+        base_url=base_url,
+        logo_mode=logo_mode,
+        user_id=user.id,
+        total=len(document_ids),
+    ).save()
+
+
+def claim_next_job():
+    # Atomic: two workers can never pick up the same job
+    now = datetime.now()
+    return ExportJob.objects(status='queued').order_by('created_at').modify(
+        set__status='running', set__started_at=now, set__heartbeat_at=now, inc__attempts=1, new=True,
+    )
+
+
+def requeue_stale_jobs():
+    """Queue running jobs again whose worker stopped reporting progress (it crashed or was killed).
+
+    A job that has already been tried EXPORT_JOB_MAX_ATTEMPTS times is failed
+    instead, so one that kills its worker can't do so forever. Returns
+    ``(requeued, failed)``.
+    """
+    cutoff = datetime.now() - timedelta(seconds=settings.EXPORT_JOB_STALE_AFTER)
+    stale = ExportJob.objects(status='running').filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at=None, started_at__lt=cutoff)
+    )
+    failed = stale.filter(attempts__gte=settings.EXPORT_JOB_MAX_ATTEMPTS).update(
+        set__status='failed', set__error="The export worker stopped while building this export.",
+        set__finished_at=datetime.now(),
+    )
+    requeued = stale.update(set__status='queued', set__processed=0)
+    return requeued, failed
+
+
+def expire_exports():
+    """Delete export archives older than EXPORT_FILE_TTL; returns how many jobs expired.
+
+    Leftover files with no finished job (partial archives from a crashed
+    worker, or archives of deleted jobs) go once they are as old.
+    """
+    cutoff = datetime.now() - timedelta(seconds=settings.EXPORT_FILE_TTL)
+    expired = ExportJob.objects(status='done', finished_at__lt=cutoff)
+    for job in expired.only('id'):
+        export_path(job).unlink(missing_ok=True)
+    count = expired.update(set__status='expired', unset__file_path=True)
+
+    directory = Path(settings.MEDIA_ROOT) / 'exports'
+    if directory.is_dir():
+        for path in directory.iterdir():
+            if path.is_file() and datetime.fromtimestamp(path.stat().st_mtime) < cutoff:
+                path.unlink(missing_ok=True)
+    return count
+
+
+def _tracked(entries, job):
+    processed = 0
+    for filename, data in entries:
+        yield filename, data
+        processed += 1
+        if processed % PROGRESS_EVERY == 0:
+            job.update(set__processed=processed, set__heartbeat_at=datetime.now())
+    job.update(set__processed=processed, set__heartbeat_at=datetime.now())
+
+
+def export_path(job):
+    return Path(settings.MEDIA_ROOT) / 'exports' / f'{job.pk}.zip'
+
+
+def run_export_job(job):
+    client = Client.load()
+    if job.kind == 'invoices':
+        entries = invoice_export_entries(job.document_ids, client, job.logo_mode or LOGO_SHARED)
+    else:
+        entries = po_export_entries(job.document_ids, client, job.base_url)
+
+    path = export_path(job)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix('.part')
+    try:
+        with open(partial, 'wb') as fh:
+            for chunk in stream_zip(_tracked(entries, job)):
+                fh.write(chunk)
+        os.replace(partial, path)
+    except Exception as exc:
+        logger.exception("Export job %s failed", job.pk)
+        partial.unlink(missing_ok=True)
+        job.update(set__status='failed', set__error=str(exc), set__finished_at=datetime.now())
+        return False
+
+    job.update(
+        set__status='done',
+        set__file_path=str(path.relative_to(settings.MEDIA_ROOT)),
+        set__finished_at=datetime.now(),
+    )
+    return True
@@ -0,0 +1,46 @@
+"""Filters shared by the invoice/PO lists, their ledger exports and reports."""
+from datetime import datetime, time, timedelta
+
+from . import search
+from .forms import ListFilterForm
+
+
+def date_range(start=None, end=None):
+    """A Mongo range query covering whole days from ``start`` to ``end`` inclusive."""
+    bounds = {}
+    if start:
+        bounds['$gte'] = datetime.combine(start, time.min)
+    if end:
+        # end is inclusive: everything before the following midnight
+        bounds['$lt'] = datetime.combine(end + timedelta(days=1), time.min)
+    return bounds
+
+
+def filter_documents(queryset, date_field, params):
+    """Apply the ``q``, ``start`` and ``end`` list filters from ``params``.
+
+    Returns ``(queryset, filtered)``. Invalid dates are ignored, as an
+    unknown cursor is.
+    """
+    form = ListFilterForm(params)
+    form.is_valid()
+    filters = form.cleaned_data
+
+    filtered = False
+    if filters.get('q'):
+        # Matches the indexed search keys (document number + vendor name) instead of regex scans
+        queryset = search.search(queryset, filters['q'])
+        filtered = True
+    bounds = date_range(filters.get('start'), filters.get('end'))
+    if bounds:
+        operators = {'$gte': 'gte', '$lt': 'lt'}
+        queryset = queryset.filter(**{f'{date_field}__{operators[op]}': value for op, value in bounds.items()})
+        filtered = True
+    return queryset, filtered
+
+
+def filter_query(params):
+    """The filter parameters as a query string, for pagination and export links."""
+    params = params.copy()
+    params.pop('cursor', None)
+    return params.urlencode()
@@ -39,9 +39,12 @@ class InvoiceForm(forms.Form):
     terms = forms.CharField(widget=forms.Textarea(attrs={'rows': 2, 'class': 'form-control'}), required=False)
     invoice_number = forms.CharField(max_length=255, required=False) # For editing
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, vendor_choices=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['vendor'].choices = [("", "Select a Vendor")] + [(str(v.id), v.name) for v in Vendor.objects.all()]
+        # Bulk imports pass the choices in rather than querying vendors per form
+        if vendor_choices is None:
+            vendor_choices = [(str(v.id), v.name) for v in Vendor.objects.only('name')]
+        self.fields['vendor'].choices = [("", "Select a Vendor")] + list(vendor_choices)
 
 class InvoiceItemForm(forms.Form):
     description = forms.CharField(widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Description'}))
@@ -80,7 +83,31 @@ class PurchaseOrderForm(forms.Form):
     po_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}), label="PO Date")
     po_number = forms.CharField(max_length=50, required=False, help_text="Leave blank to auto-generate.", label="PO Number")
     terms = forms.CharField(widget=forms.Textarea(attrs={'rows': 3, 'class': 'form-control'}), required=False, label="Terms & Conditions")
+    status = forms.ChoiceField(choices=[('open', 'Open'), ('closed', 'Closed')], initial='open',
+                               widget=forms.Select(attrs={'class': 'form-select'}))
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['vendor'].choices = [("", "Select a Vendor")] + [(str(v.id), v.name) for v in Vendor.objects.all()]
+
+
+class InvoiceImportForm(forms.Form):
+    file = forms.FileField(help_text="CSV (one row per line item) or JSON lines (one invoice per line).")
+    dry_run = forms.BooleanField(required=False, label="Validate only", widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}))
+
+
+# --- List Filters ---
+
+class ListFilterForm(forms.Form):
+    q = forms.CharField(required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+
+
+# --- Report Forms ---
+
+class ReportFilterForm(forms.Form):
+    period = forms.ChoiceField(choices=[('day', 'Day'), ('month', 'Month'), ('year', 'Year')], initial='month', required=False,
+                               widget=forms.Select(attrs={'class': 'form-select'}))
+    start = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    end = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
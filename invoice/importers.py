@@ -0,0 +1,321 @@
+"""Bulk invoice import from CSV or JSON lines.
+
+Input is parsed one record at a time and validated with the same
+``InvoiceForm``/``InvoiceItemForm`` rules as the invoice form. Valid invoices
+are collected into batches; each batch reserves its invoice numbers with one
+counter update per vendor and is written with a single unordered
+``insert_many``, so one bad row never aborts the rest of the batch.
+
+CSV files have one row per line item. Consecutive rows with the same
+``reference`` (or ``invoice_number``) form one invoice; the invoice columns
+are read from its first row::
+
+    reference,vendor,invoice_date,terms,invoice_number,description,quantity,unit_price,discount,tax
+
+JSON lines files have one invoice per line, with its line items in ``items``.
+``vendor`` is a vendor id or its exact name (case-insensitive).
+
+Files are decoded as UTF-8 with :data:`ENCODING_ERRORS`, so a record with
+bytes in another encoding is reported as an error of its own instead of
+aborting the import.
+"""
+import csv
+import io
+import json
+import re
+import time
+from datetime import datetime
+from itertools import groupby
+
+import mongoengine as me
+from pymongo.errors import BulkWriteError
+
+from . import rollups, search, sequences
+from .forms import InvoiceForm, InvoiceItemForm
+from .models import Invoice, InvoiceItem, Vendor, last_issued_number
+
+DEFAULT_BATCH_SIZE = 500
+
+INVOICE_COLUMNS = ('vendor', 'invoice_date', 'terms', 'invoice_number')
+ITEM_COLUMNS = ('description', 'quantity', 'unit_price', 'discount', 'tax')
+
+FORMATS = ('csv', 'jsonl')
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on', 'x'}
+
+ENCODING = 'utf-8-sig'
+# Undecodable bytes become lone surrogates, which the readers look for
+ENCODING_ERRORS = 'surrogateescape'
+_UNDECODABLE = re.compile('[\udc80-\udcff]')
+UNDECODABLE_ERROR = "not valid UTF-8; save the file as UTF-8 and import it again"
+
+
+def open_text(binary):
+    """A text stream over an uploaded (binary) file, decoded like :func:`open_file`."""
+    return io.TextIOWrapper(binary, encoding=ENCODING, errors=ENCODING_ERRORS, newline='')
+
+
+def open_file(path):
+    return open(path, encoding=ENCODING, errors=ENCODING_ERRORS, newline='')
+
+
+def detect_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+class CSVReader:
+    """Yields ``(row, record, error)``, ``row`` being the first line of the record."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.rows_read = 0
+
+    def _group_key(self, numbered):
+        row, data = numbered
+        # Rows without a reference or number are invoices of their own
+        return (data.get('reference') or '').strip() or (data.get('invoice_number') or '').strip() or ('row', row)
+
+    def __iter__(self):
+        reader = csv.DictReader(self.stream)
+        # Line 1 is the header
+        numbered = enumerate(reader, start=2)
+        try:
+            for _, group in groupby(numbered, key=self._group_key):
+                group = list(group)
+                self.rows_read += len(group)
+                first_row, first = group[0]
+                record = {column: first.get(column) for column in INVOICE_COLUMNS}
+                record['items'] = [{column: data.get(column) for column in ITEM_COLUMNS} for _, data in group]
+                if any(_UNDECODABLE.search(value) for _, data in group for value in data.values() if isinstance(value, str)):
+                    yield first_row, None, UNDECODABLE_ERROR
+                    continue
+                yield first_row, record, None
+        except csv.Error as e:
+            # The reader can't resynchronise after this, so the rest of the file is skipped
+            yield reader.line_num, None, f"unreadable CSV, import stopped here: {e}"
+
+
+class JSONLinesReader:
+    def __init__(self, stream):
+        self.stream = stream
+        self.rows_read = 0
+
+    def __iter__(self):
+        for row, line in enumerate(self.stream, start=1):
+            if not line.strip():
+                continue
+            self.rows_read += 1
+            if _UNDECODABLE.search(line):
+                yield row, None, UNDECODABLE_ERROR
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row, None, f"invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield row, None, "expected a JSON object"
+                continue
+            yield row, record, None
+
+
+READERS = {'csv': CSVReader, 'jsonl': JSONLinesReader}
+
+
+class VendorIndex:
+    """Every vendor loaded once, for form choices and id/name lookups."""
+
+    def __init__(self):
+        vendors = list(Vendor.objects.only('name'))
+        self.by_id = {str(vendor.pk): vendor for vendor in vendors}
+        self.by_name = {vendor.name.strip().lower(): vendor for vendor in vendors}
+        self.choices = [(pk, vendor.name) for pk, vendor in self.by_id.items()]
+
+    def resolve(self, value):
+        value = str(value or '').strip()
+        if value in self.by_id:
+            return value
+        vendor = self.by_name.get(value.lower())
+        # Unknown vendors are passed through for the form to reject
+        return str(vendor.pk) if vendor else value
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.invoices = 0
+        self.valid = 0
+        self.imported = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def error(self, row, message):
+        self.errors.append((row, message))
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self.started
+        return self
+
+    @property
+    def rows_per_second(self):
+        elapsed = self.elapsed or (time.monotonic() - self.started)
+        return self.rows / elapsed if elapsed else 0.0
+
+
+def _form_errors(form, prefix=''):
+    return [f"{prefix}{field}: {message}" for field, messages in form.errors.items() for message in messages]
+
+
+def _text(value):
+    # Form data is text; JSON lines records can hold numbers and booleans too
+    if value is None:
+        return ''
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    raise ValueError("expected text or a number")
+
+
+def _form_data(data, fields, prefix=''):
+    values, errors = {}, []
+    for field in fields:
+        try:
+            values[field] = _text(data.get(field))
+        except ValueError as e:
+            errors.append(f"{prefix}{field}: {e}")
+    return values, errors
+
+
+def _truthy(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in TRUE_VALUES
+
+
+def build_invoice(record, vendors):
+    """Validate one record; returns ``(invoice, errors)``. The invoice is not numbered yet."""
+    data, errors = _form_data(record, INVOICE_COLUMNS)
+    if errors:
+        return None, errors
+    data['vendor'] = vendors.resolve(data['vendor'])
+    invoice_form = InvoiceForm(data, vendor_choices=vendors.choices)
+    errors = [] if invoice_form.is_valid() else _form_errors(invoice_form)
+
+    items = []
+    raw_items = record.get('items') or []
+    if not isinstance(raw_items, list):
+        errors.append("items: expected a list of line items")
+        raw_items = []
+    elif not raw_items:
+        errors.append("items: at least one line item is required")
+    for number, item in enumerate(raw_items, start=1):
+        if not isinstance(item, dict):
+            errors.append(f"item {number}: expected an object")
+            continue
+        data, item_errors = _form_data(item, [column for column in ITEM_COLUMNS if column != 'tax'], f"item {number} ")
+        if item_errors:
+            errors += item_errors
+            continue
+        data['tax'] = 'on' if _truthy(item.get('tax')) else ''
+        item_form = InvoiceItemForm(data)
+        if not item_form.is_valid():
+            errors += _form_errors(item_form, f"item {number} ")
+            continue
+        items.append(InvoiceItem(
+            description=item_form.cleaned_data['description'],
+            quantity=item_form.cleaned_data['quantity'],
+            unit_price=item_form.cleaned_data['unit_price'],
+            discount=item_form.cleaned_data.get('discount') or 0.0,
+            tax=item_form.cleaned_data.get('tax', False),
+        ))
+    if errors:
+        return None, errors
+
+    invoice = Invoice(
+        vendor=vendors.by_id[invoice_form.cleaned_data['vendor']],
+        invoice_date=invoice_form.cleaned_data['invoice_date'],
+        terms=invoice_form.cleaned_data['terms'],
+        invoice_number=invoice_form.cleaned_data['invoice_number'] or None,
+        items=items,
+    )
+    try:
+        invoice.validate()
+    except me.ValidationError as e:
+        return None, [str(e)]
+    return invoice, []
+
+
+def _assign_numbers(invoices):
+    """Number the invoices that have none, reserving one block per sequence key."""
+    year = datetime.now().year
+    by_key, given = {}, {}
+    for invoice in invoices:
+        if not invoice.invoice_number:
+            by_key.setdefault(sequences.sequence_key('INV', invoice.vendor.initials, year), []).append(invoice)
+        elif parsed := sequences.split_number(invoice.invoice_number, 'INV'):
+            given[parsed[0]] = max(given.get(parsed[0], 0), parsed[1])
+    # Numbers given in the file move their counters first, so the blocks skip them
+    for key, value in given.items():
+        sequences.raise_to(key, value, start=lambda key=key: last_issued_number(Invoice, 'invoice_number', key))
+    for key, numbered in by_key.items():
+        block = sequences.allocate(
+            key, len(numbered), start=lambda key=key: last_issued_number(Invoice, 'invoice_number', key),
+        )
+        for invoice, number in zip(numbered, block):
+            invoice.invoice_number = f'{key}/{number:04d}'
+
+
+def _write_batch(batch, result):
+    _assign_numbers([invoice for _, invoice in batch])
+    documents = []
+    for _, invoice in batch:
+        invoice.recompute_totals()
+        invoice.search_keys = search.document_keys(invoice.invoice_number, invoice.vendor.name)
+        invoice.search_text = search.document_text(invoice.invoice_number, invoice.vendor.name)
+        documents.append(invoice.to_mongo().to_dict())
+
+    failed = set()
+    try:
+        Invoice._get_collection().insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        for write_error in e.details.get('writeErrors', []):
+            failed.add(write_error['index'])
+            message = "duplicate invoice number" if write_error.get('code') == 11000 else write_error.get('errmsg')
+            result.error(batch[write_error['index']][0], message)
+
+    inserted = [document for index, document in enumerate(documents) if index not in failed]
+    result.imported += len(inserted)
+    # insert_many bypasses Invoice.save(), so the dashboard rollups are updated here
+    rollups.record([], [contribution for document in inserted for contribution in rollups.invoice_contributions(document)])
+
+
+def import_invoices(stream, format='csv', batch_size=DEFAULT_BATCH_SIZE, dry_run=False, progress=None):
+    """Import invoices from a text stream; returns an :class:`ImportResult`.
+
+    ``progress`` is called with the result after every batch.
+    """
+    reader = READERS[format](stream)
+    vendors = VendorIndex()
+    result = ImportResult()
+    batch = []
+
+    def flush():
+        if batch and not dry_run:
+            _write_batch(batch, result)
+        batch.clear()
+        result.rows = reader.rows_read
+        if progress:
+            progress(result)
+
+    for row, record, error in reader:
+        result.invoices += 1
+        invoice, errors = (None, [error]) if error else build_invoice(record, vendors)
+        if errors:
+            result.error(row, '; '.join(errors))
+            continue
+        result.valid += 1
+        batch.append((row, invoice))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return result.finish()
@@ -0,0 +1,138 @@
+"""Per-request counts and timings of MongoDB commands and SQL queries.
+
+:func:`capture_queries` records every Mongo command (through the pymongo
+:class:`CommandListener` that invoice.mongo installs on each client) and
+every SQL query (through a wrapper on each database connection's
+``execute_wrappers``) made in its block::
+
+    with capture_queries() as log:
+        client.get('/invoices/')
+    assert log.mongo_count <= 3 and log.sql_count <= 2
+
+The log lives in a context variable, so it follows the request through
+``sync_to_async`` threads and async tasks, and commands issued outside any
+capture cost one lookup. ``QueryInstrumentationMiddleware`` wraps every
+request in a capture and reports it.
+"""
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from pymongo import monitoring
+
+# Every capture active in this context, innermost last
+_active = ContextVar('invoice_query_logs', default=())
+
+
+class QueryLog:
+    def __init__(self):
+        self.mongo = []  # (command, collection, seconds)
+        self.sql = []  # (sql, seconds)
+        self._pending = {}
+
+    @property
+    def mongo_count(self):
+        return len(self.mongo)
+
+    @property
+    def mongo_seconds(self):
+        return sum(seconds for _, _, seconds in self.mongo)
+
+    @property
+    def sql_count(self):
+        return len(self.sql)
+
+    @property
+    def sql_seconds(self):
+        return sum(seconds for _, seconds in self.sql)
+
+    def collections(self):
+        """``{collection: commands}``, most used first."""
+        return dict(Counter(collection for _, collection, _ in self.mongo).most_common())
+
+    def commands(self):
+        return dict(Counter(f'{command} {collection}' for command, collection, _ in self.mongo).most_common())
+
+    def as_dict(self):
+        return {
+            'mongo': {
+                'count': self.mongo_count,
+                'ms': round(self.mongo_seconds * 1000, 2),
+                'collections': self.collections(),
+            },
+            'sql': {'count': self.sql_count, 'ms': round(self.sql_seconds * 1000, 2)},
+        }
+
+
+def current_log():
+    logs = _active.get()
+    return logs[-1] if logs else None
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    # Handshakes and server monitoring aren't the application's queries
+    IGNORED = {'hello', 'ismaster', 'isMaster', 'ping', 'endSessions', 'saslStart', 'saslContinue'}
+
+    def started(self, event):
+        logs = _active.get()
+        if not logs or event.command_name in self.IGNORED:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            # e.g. getMore, whose value is the cursor id
+            collection = event.command.get('collection', '')
+        for log in logs:
+            log._pending[(event.request_id, event.connection_id)] = (event.command_name, collection)
+
+    def _finished(self, event):
+        for log in _active.get():
+            pending = log._pending.pop((event.request_id, event.connection_id), None)
+            if pending is not None:
+                log.mongo.append((*pending, event.duration_micros / 1e6))
+
+    succeeded = failed = _finished
+
+
+command_listener = MongoCommandListener()
+
+
+def _record_sql(execute, sql, params, many, context):
+    logs = _active.get()
+    if not logs:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        for log in logs:
+            log.sql.append((sql, elapsed))
+
+
+@receiver(connection_created)
+def install_sql_wrapper(sender=None, connection=None, **kwargs):
+    # Installed on every connection rather than per capture: connections are
+    # per thread, and an async view's queries run in a sync_to_async thread
+    if _record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_sql)
+
+
+@contextmanager
+def capture_queries():
+    """Record the Mongo commands and SQL queries made inside the block.
+
+    Captures nest: a test's capture around a client request also sees the
+    queries the middleware's own capture records.
+    """
+    for connection in connections.all(initialized_only=True):
+        install_sql_wrapper(connection=connection)
+    log = QueryLog()
+    token = _active.set(_active.get() + (log,))
+    try:
+        yield log
+    finally:
+        _active.reset(token)
@@ -0,0 +1,114 @@
+"""Flat CSV ledgers with one row per invoice or purchase order line item.
+
+Documents are read as raw SON through a server-side cursor (``no_cache()``,
+``batch_size()`` and a field projection), and rows are emitted one batch at
+a time, so memory stays flat however many lines are exported.
+"""
+import csv
+from itertools import islice
+
+from . import totals
+from .models import Vendor
+
+LEDGER_BATCH_SIZE = 500
+
+INVOICE_LEDGER_HEADER = (
+    'invoice_number', 'invoice_date', 'vendor', 'description', 'quantity', 'unit_price',
+    'amount', 'discount', 'tax', 'net_amount',
+)
+PO_LEDGER_HEADER = (
+    'po_number', 'po_date', 'vendor', 'status', 'description', 'quantity', 'unit_price', 'amount',
+)
+
+# Spreadsheet apps evaluate cells starting with these. Only the free-text
+# columns are escaped: numbers are written as they are, so a negative amount
+# stays a number
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    """File-like object whose ``write`` returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _money(value):
+    return f'{value:.2f}'
+
+
+def _batches(queryset, batch_size):
+    # A plain generator: iter() on a no_cache() queryset rewinds a clone, which
+    # islice would do on every call
+    cursor = (son for son in queryset.no_cache().batch_size(batch_size).as_pymongo())
+    while True:
+        batch = list(islice(cursor, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def _vendor_names(batch, names):
+    # Names are fetched once per vendor, for the vendors each batch introduces
+    missing = {son['vendor'] for son in batch if son.get('vendor') and son['vendor'] not in names}
+    if missing:
+        found = Vendor.objects(pk__in=list(missing)).only('name').as_pymongo()
+        names.update({vendor['_id']: vendor['name'] for vendor in found})
+        names.update({pk: '' for pk in missing if pk not in names})
+    return names
+
+
+def _ledger(queryset, fields, date_field, header, rows_for, batch_size):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+
+    names = {}
+    queryset = queryset.only(*fields).order_by(date_field, 'id')
+    for batch in _batches(queryset, batch_size):
+        _vendor_names(batch, names)
+        yield ''.join(
+            writer.writerow(row)
+            for son in batch
+            for row in rows_for(son, names.get(son.get('vendor'), ''))
+        )
+
+
+def _invoice_rows(son, vendor):
+    date = son.get('invoice_date')
+    for item in son.get('items') or []:
+        discount = item.get('discount') or 0
+        amount, tax_amount, net_amount = totals.line_figures(
+            item.get('quantity') or 0, item.get('unit_price') or 0, discount, item.get('tax'),
+        )
+        yield (
+            _cell(son.get('invoice_number')), date.strftime('%Y-%m-%d') if date else '', _cell(vendor),
+            _cell(item.get('description')), item.get('quantity'), _money(item.get('unit_price') or 0),
+            _money(amount), _money(discount), _money(tax_amount), _money(net_amount),
+        )
+
+
+def _po_rows(son, vendor):
+    date = son.get('po_date')
+    for item in son.get('items') or []:
+        amount = totals.line_figures(item.get('quantity') or 0, item.get('unit_price') or 0)[0]
+        yield (
+            _cell(son.get('po_number')), date.strftime('%Y-%m-%d') if date else '', _cell(vendor), son.get('status', 'open'),
+            _cell(item.get('description')), item.get('quantity'), _money(item.get('unit_price') or 0), _money(amount),
+        )
+
+
+def invoice_ledger(queryset, batch_size=LEDGER_BATCH_SIZE):
+    """CSV chunks (header first) for every line item of the invoices in ``queryset``."""
+    fields = ('invoice_number', 'invoice_date', 'vendor', 'items')
+    return _ledger(queryset, fields, 'invoice_date', INVOICE_LEDGER_HEADER, _invoice_rows, batch_size)
+
+
+def po_ledger(queryset, batch_size=LEDGER_BATCH_SIZE):
+    fields = ('po_number', 'po_date', 'vendor', 'status', 'items')
+    return _ledger(queryset, fields, 'po_date', PO_LEDGER_HEADER, _po_rows, batch_size)
@@ -0,0 +1,151 @@
+import calendar
+import hashlib
+import io
+import logging
+import os
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from mongoengine.errors import NotUniqueError
+from PIL import Image, ImageDraw, ImageFont
+
+from .models import LogoThumbnail
+
+logger = logging.getLogger(__name__)
+
+# Bump LOGO_STYLE_VERSION (and LOGO_STYLE_DATE, served as Last-Modified)
+# whenever the drawing below changes, so cached renderings are not reused.
+LOGO_STYLE_VERSION = 1
+LOGO_STYLE_DATE = calendar.timegm(datetime(2025, 10, 1).timetuple())
+
+LOGO_SIZES = (32, 64, 100, 128)
+# Image modes thumbnails are saved in as they are; others are converted to RGBA
+PNG_MODES = ('RGB', 'RGBA', 'L', 'LA', 'P')
+DEFAULT_LOGO_SIZE = 100
+
+STYLES = {
+    'circle': {'background': (73, 109, 137), 'foreground': (255, 255, 0)},
+}
+DEFAULT_STYLE = 'circle'
+
+FONT_CANDIDATES = ('arial.ttf', 'DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+
+@lru_cache(maxsize=None)
+def load_font(size):
+    for candidate in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def preload_fonts():
+    for size in LOGO_SIZES:
+        load_font(_font_size(size))
+
+
+def _font_size(size):
+    return int(size * 0.4)
+
+
+def logo_key(initials, size, style):
+    return hashlib.sha1(f'{LOGO_STYLE_VERSION}:{style}:{size}:{initials}'.encode()).hexdigest()
+
+
+def logo_etag(initials, size=DEFAULT_LOGO_SIZE, style=DEFAULT_STYLE):
+    return f'"{logo_key(initials, size, style)}"'
+
+
+def _draw(initials, size, style):
+    colors = STYLES[style]
+    img = Image.new('RGBA', (size, size), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(img)
+    draw.ellipse((0, 0, size, size), fill=colors['background'], outline=None)
+
+    # Center the text
+    font = load_font(_font_size(size))
+    text_width = font.getlength(initials)
+    draw.text(((size - text_width) / 2, size / 4), initials, fill=colors['foreground'], font=font)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _cache_dir():
+    return Path(settings.MEDIA_ROOT) / 'logo_cache'
+
+
+@lru_cache(maxsize=1024)
+def render_initials_logo(initials, size=DEFAULT_LOGO_SIZE, style=DEFAULT_STYLE):
+    """PNG bytes of the fallback logo, from memory, then disk, then Pillow."""
+    path = _cache_dir() / f'{logo_key(initials, size, style)}.png'
+    try:
+        return path.read_bytes()
+    except OSError:
+        pass
+
+    data = _draw(initials, size, style)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix(f'.{os.getpid()}.tmp')
+        partial.write_bytes(data)
+        os.replace(partial, path)
+    except OSError:
+        pass  # The disk tier is best effort; the in-memory copy still serves
+    return data
+
+
+def gridfs_etag(grid_out):
+    md5 = getattr(grid_out, 'md5', None)
+    return f'"{md5}"' if md5 else f'"{grid_out._id}-{grid_out.length}"'
+
+
+def gridfs_last_modified(grid_out):
+    return calendar.timegm(grid_out.upload_date.utctimetuple())
+
+
+def _resize(data, size):
+    # PNG bytes of the image scaled down to fit ``size``, or None for files
+    # Pillow can't read (truncated, unknown or oversized)
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.mode not in PNG_MODES:
+            # e.g. CMYK JPEGs, which PNG can't store
+            image = image.convert('RGBA')
+        image.thumbnail((size, size))
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+    except (OSError, Image.DecompressionBombError):
+        return None
+    return buffer.getvalue()
+
+
+def thumbnail_file(source, size):
+    """GridOut for ``source`` (an uploaded logo proxy) resized to ``size``, created on first use.
+
+    None when there is no file or it can't be resized.
+    """
+    thumbnail = LogoThumbnail.objects(source_id=source.grid_id, size=size).first()
+    if thumbnail is None:
+        data = source.read()
+        if data is None:
+            return None
+        resized = _resize(data, size)
+        if resized is None:
+            logger.warning("Can't make a %spx thumbnail of logo %s; serving the original", size, source.grid_id)
+            return None
+
+        thumbnail = LogoThumbnail(source_id=source.grid_id, size=size)
+        thumbnail.image.put(resized, content_type='image/png')
+        try:
+            thumbnail.save()
+        except NotUniqueError:
+            # Another request generated it first; keep theirs
+            thumbnail.image.delete()
+            thumbnail = LogoThumbnail.objects.get(source_id=source.grid_id, size=size)
+    return thumbnail.image.get()
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice import search
+from invoice.models import Vendor, Client, Invoice, PurchaseOrder
+from invoice.pagination import KeysetPaginator, encode_cursor
+
+DOCUMENTS = (Vendor, Client, Invoice, PurchaseOrder)
+
+
+def _plan_stages(plan):
+    stages = [plan.get('stage')]
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        stages += _plan_stages(child)
+    return [stage for stage in stages if stage]
+
+
+def list_queries():
+    # The same querysets invoice_list / po_list build, first page and a deep page
+    cursor = encode_cursor('next', datetime.now(), ObjectId())
+    vendor = Vendor.objects.only('id').first()
+    vendor_id = vendor.pk if vendor else ObjectId()
+
+    for document, date_field in ((Invoice, 'invoice_date'), (PurchaseOrder, 'po_date')):
+        name = document._meta['collection']
+        for label, queryset in (
+            ('list', document.objects.all()),
+            ('search', search.search(document.objects.all(), 'inv')),
+            ('vendor', document.objects(vendor=vendor_id)),
+        ):
+            paginator = KeysetPaginator(queryset, date_field)
+            yield f'{name} {label} page 1', paginator.window()[1].limit(11)
+            yield f'{name} {label} deep page', paginator.window(cursor)[1].limit(11)
+    yield 'vendors by user', Vendor.objects(user_id=1)
+
+
+class Command(BaseCommand):
+    help = "Compare the indexes declared in document meta with the ones that exist in MongoDB."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--create', action='store_true', help="Create any missing declared indexes.")
+        parser.add_argument('--explain', action='store_true', help="Explain the list queries and fail on collection scans.")
+
+    def handle(self, *args, **options):
+        problems = 0
+        for document in DOCUMENTS:
+            if options['create']:
+                document.ensure_indexes()
+
+            name = document._meta['collection']
+            diff = document.compare_indexes()
+            for fields in diff['missing']:
+                problems += 1
+                self.stdout.write(self.style.ERROR(f"{name}: missing index {fields}"))
+            for fields in diff['extra']:
+                self.stdout.write(self.style.WARNING(f"{name}: undeclared index {fields}"))
+            if not diff['missing']:
+                self.stdout.write(f"{name}: all declared indexes present")
+
+        if options['explain']:
+            for label, queryset in list_queries():
+                stages = _plan_stages(queryset.explain()['queryPlanner']['winningPlan'])
+                if 'COLLSCAN' in stages:
+                    problems += 1
+                    self.stdout.write(self.style.ERROR(f"{label}: COLLSCAN ({' > '.join(stages)})"))
+                else:
+                    self.stdout.write(f"{label}: {' > '.join(stages)}")
+
+        if problems:
+            raise CommandError(f"{problems} index problem(s) found.")
+        self.stdout.write(self.style.SUCCESS("Indexes match the declared plan."))
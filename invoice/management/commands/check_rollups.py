@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice import rollups
+
+
+class Command(BaseCommand):
+    help = "Compare the dashboard rollups with a full recompute and report any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--fix', action='store_true', help="Rebuild the rollups when they have drifted.")
+
+    def handle(self, *args, **options):
+        mismatches = rollups.check(options['batch_size'])
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Rollups match a full recompute."))
+            return
+
+        for key, (count, total), (stored_count, stored_total) in mismatches:
+            self.stdout.write(f"{key}: expected {count} / {total:.2f}, stored {stored_count} / {stored_total:.2f}")
+        if options['fix']:
+            written = rollups.rebuild(options['batch_size'])
+            self.stdout.write(self.style.WARNING(f"Rebuilt {written} rollup(s)."))
+            return
+        raise CommandError(f"{len(mismatches)} rollup(s) have drifted; run rebuild_rollups or check_rollups --fix.")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice import importers
+
+
+class Command(BaseCommand):
+    help = "Import invoices from a CSV (one row per line item) or JSON lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=importers.FORMATS, help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=importers.DEFAULT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Validate every row without writing anything.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or importers.detect_format(path)
+
+        def progress(result):
+            self.stdout.write(f"{result.rows} rows, {result.imported} imported ({result.rows_per_second:.0f} rows/s)")
+
+        try:
+            with importers.open_file(path) as stream:
+                result = importers.import_invoices(
+                    stream, format, batch_size=options['batch_size'], dry_run=options['dry_run'], progress=progress,
+                )
+        except OSError as e:
+            raise CommandError(e)
+
+        for row, message in result.errors:
+            self.stderr.write(f"row {row}: {message}")
+        done = f"{result.valid} of {result.invoices} invoice(s) valid" if options['dry_run'] else f"Imported {result.imported} of {result.invoices} invoice(s)"
+        summary = f"{done} from {result.rows} rows in {result.elapsed:.2f}s ({result.rows_per_second:.0f} rows/s), {len(result.errors)} error(s)."
+        self.stdout.write(self.style.WARNING(summary) if result.errors else self.style.SUCCESS(summary))
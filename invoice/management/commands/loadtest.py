@@ -0,0 +1,127 @@
+import http.client
+import json
+import statistics
+import threading
+import time
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ['/invoices/', '/purchase-orders/']
+
+
+def session_cookie(username):
+    """A logged-in session cookie for ``username``, created directly in the session store."""
+    User = get_user_model()
+    try:
+        user = User.objects.get(username=username)
+    except User.DoesNotExist:
+        raise CommandError(f"No user named {username!r}")
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+
+def run_load(base_url, paths, requests, concurrency, headers):
+    """Fire ``requests`` GETs (cycling through ``paths``) from ``concurrency`` keep-alive connections."""
+    url = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    lock = threading.Lock()
+    issued = [0]
+    latencies, statuses = [], {}
+
+    def worker():
+        connection = connection_class(url.hostname, url.port)
+        while True:
+            with lock:
+                if issued[0] >= requests:
+                    break
+                index = issued[0]
+                issued[0] += 1
+            path = url.path.rstrip('/') + paths[index % len(paths)]
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                if response.getheader('Connection', '').lower() == 'close':
+                    connection.close()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status = 'error'
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+    return {
+        'base_url': base_url,
+        'requests': len(latencies),
+        'concurrency': concurrency,
+        'duration': duration,
+        'rps': len(latencies) / duration if duration else 0.0,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'statuses': {str(status): count for status, count in statuses.items()},
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure requests per second against running servers, e.g. the WSGI app and the same app "
+        "under uvicorn with INVOICE_ASYNC_VIEWS=1."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_urls', nargs='+', help="One or more servers to compare, e.g. http://127.0.0.1:8000")
+        parser.add_argument('--path', action='append', dest='paths', help="Path to request (repeatable).")
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=20, help="Requests sent to each server before measuring.")
+        parser.add_argument('--user', help="Send the requests logged in as this user.")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        headers = {'Cookie': session_cookie(options['user'])} if options['user'] else {}
+
+        results = []
+        for base_url in options['base_urls']:
+            if options['warmup']:
+                run_load(base_url, paths, options['warmup'], min(options['concurrency'], options['warmup']), headers)
+            results.append(run_load(base_url, paths, options['requests'], options['concurrency'], headers))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        baseline = results[0]['rps']
+        for result in results:
+            ratio = f" ({result['rps'] / baseline:.2f}x)" if baseline and result is not results[0] else ''
+            self.stdout.write(
+                f"{result['base_url']}: {result['rps']:.1f} req/s{ratio}, "
+                f"p50 {result['p50_ms']:.1f}ms, p95 {result['p95_ms']:.1f}ms, p99 {result['p99_ms']:.1f}ms, "
+                f"statuses {result['statuses']}"
+            )
+            if set(result['statuses']) - {'200', '304'}:
+                self.stdout.write(self.style.WARNING("  Some requests did not succeed; check --user and the paths."))
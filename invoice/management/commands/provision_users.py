@@ -0,0 +1,69 @@
+import csv
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from invoice.models import Profile
+
+ROLES = {role for role, _ in Profile.ROLE_CHOICES}
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users and their profiles in bulk from a CSV file with the columns "
+        "username,email,first_name,last_name,role,password (only username is required). "
+        "Existing usernames are skipped. Users without a password get an unusable one "
+        "and must reset it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--role', default='project_manager', choices=sorted(ROLES),
+                            help="Role for rows that don't set one.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as f:
+                rows = list(csv.DictReader(f))
+        except OSError as e:
+            raise CommandError(e)
+
+        users, roles = [], {}
+        for line, row in enumerate(rows, start=2):
+            username = (row.get('username') or '').strip()
+            role = (row.get('role') or '').strip() or options['role']
+            if not username:
+                raise CommandError(f"Line {line}: username is required")
+            if role not in ROLES:
+                raise CommandError(f"Line {line}: unknown role {role!r}")
+            if username in roles:
+                raise CommandError(f"Line {line}: duplicate username {username!r}")
+            roles[username] = role
+            users.append(User(
+                username=username,
+                email=(row.get('email') or '').strip(),
+                first_name=(row.get('first_name') or '').strip(),
+                last_name=(row.get('last_name') or '').strip(),
+                # make_password(None) is an unusable password
+                password=make_password(row.get('password') or None),
+            ))
+
+        existing = set(User.objects.filter(username__in=list(roles)).values_list('username', flat=True))
+        users = [user for user in users if user.username not in existing]
+
+        # bulk_create sends no post_save, so the profiles are created here too
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=options['batch_size'])
+            created = User.objects.filter(username__in=[user.username for user in users]).values_list('pk', 'username')
+            Profile.objects.bulk_create(
+                [Profile(user_id=pk, role=roles[username]) for pk, username in created],
+                batch_size=options['batch_size'],
+                ignore_conflicts=True,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(users)} user(s); skipped {len(existing)} existing."
+        ))
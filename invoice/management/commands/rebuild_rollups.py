@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from invoice import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the dashboard rollups from every invoice and purchase order."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rollups.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} rollup(s)."))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from invoice import search
+from invoice.models import Vendor, Invoice, PurchaseOrder
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored search keys on vendors, invoices and purchase orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def _flush(self, document, operations):
+        if operations:
+            document._get_collection().bulk_write(operations, ordered=False)
+        return []
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        vendor_names = {}
+        operations = []
+        for vendor in Vendor.objects.only('name').no_cache():
+            vendor_names[vendor.pk] = vendor.name
+            operations.append(UpdateOne({'_id': vendor.pk}, {'$set': {'search_keys': sorted(search.text_keys(vendor.name))}}))
+            if len(operations) >= batch_size:
+                operations = self._flush(Vendor, operations)
+        self._flush(Vendor, operations)
+        self.stdout.write(f"Indexed {len(vendor_names)} vendors.")
+
+        for document, number_field in ((Invoice, 'invoice_number'), (PurchaseOrder, 'po_number')):
+            operations = []
+            count = 0
+            rows = document.objects.only(number_field, 'vendor').no_dereference().no_cache().batch_size(batch_size)
+            for doc in rows:
+                number = getattr(doc, number_field)
+                vendor_name = vendor_names.get(getattr(doc.vendor, 'id', doc.vendor), '')
+                operations.append(UpdateOne({'_id': doc.pk}, {'$set': {
+                    'search_keys': search.document_keys(number, vendor_name),
+                    'search_text': search.document_text(number, vendor_name),
+                }}))
+                count += 1
+                if len(operations) >= batch_size:
+                    operations = self._flush(document, operations)
+            self._flush(document, operations)
+            self.stdout.write(f"Indexed {count} {document._meta['collection']}.")
+
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
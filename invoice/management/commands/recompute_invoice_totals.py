@@ -0,0 +1,56 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from invoice import rollups, totals
+from invoice.models import Invoice, TOTALS_VERSION
+
+TOTAL_FIELDS = ('sub_total', 'discount_total', 'tax_total', 'total')
+
+# Stored totals within this of the batch engine's figures are taken as current
+TOLERANCE = 0.005
+
+
+class Command(BaseCommand):
+    help = "Backfill the stored totals on invoices saved with an older (or no) totals version."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Check every invoice, not just stale ones.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        invoices = Invoice.objects.all() if options['all'] else Invoice.objects(totals_version__ne=TOTALS_VERSION)
+        invoices = invoices.only('items', 'totals_version', *{*TOTAL_FIELDS, *rollups.INVOICE_FIELDS}).no_cache().batch_size(options['batch_size'])
+
+        collection = Invoice._get_collection()
+        # A plain generator: iter() on a no_cache() queryset rewinds it
+        invoices = (invoice for invoice in invoices)
+        checked = updated = 0
+        while batch := list(islice(invoices, options['batch_size'])):
+            checked += len(batch)
+            operations, before, after = [], [], []
+            for invoice in self._changed(batch):
+                figures = invoice.compute_totals()
+                operations.append(UpdateOne({'_id': invoice.pk}, {'$set': figures, '$inc': {'revision': 1}}))
+                # The bulk update bypasses save(), so keep the dashboard rollups in step here
+                stored = invoice.to_mongo()
+                before += rollups.invoice_contributions(stored)
+                after += rollups.invoice_contributions(dict(stored, total=figures['total']))
+            if operations:
+                updated += collection.bulk_write(operations, ordered=False).modified_count
+                rollups.record(before, after)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {checked} invoice(s); recomputed totals on {updated} (version {TOTALS_VERSION})."
+        ))
+
+    def _changed(self, batch):
+        # Stale invoices always need the exact (Decimal) recompute. For current
+        # ones, the vectorized float pass finds the few whose stored totals no
+        # longer match their items, and only those are recomputed and written.
+        for invoice, figures in zip(batch, totals.batch_invoice_totals(batch)):
+            if invoice.totals_stale or any(
+                abs((getattr(invoice, field) or 0) - figures[field]) > TOLERANCE for field in TOTAL_FIELDS
+            ):
+                yield invoice
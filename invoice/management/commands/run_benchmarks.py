@@ -0,0 +1,100 @@
+import json
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from mongoengine.connection import disconnect_all
+
+from invoice import benchmarks, mongo
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the views and model hot paths against the configured database (fill it with "
+        "seed_data), write a JSON report and fail if it regresses from a baseline report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', help="Run benchmarks whose name contains this (repeatable).")
+        parser.add_argument('--list', action='store_true', help="List the benchmarks and exit.")
+        parser.add_argument('--repeat', type=int, default=benchmarks.DEFAULT_REPEAT)
+        parser.add_argument('--warmup', type=int, default=benchmarks.DEFAULT_WARMUP)
+        parser.add_argument('--output', help="Write the report to this file.")
+        parser.add_argument('--baseline', help="Compare with this report and fail on regressions.")
+        parser.add_argument('--database', help=(
+            "Benchmark this MongoDB database instead of MONGODB_NAME. Without it, MONGODB_NAME must start "
+            f"with {' or '.join(benchmarks.SCRATCH_DATABASE_PREFIXES)}: the benchmarks write to the database."
+        ))
+        parser.add_argument('--tolerance', type=float, default=benchmarks.DEFAULT_TOLERANCE,
+                            help="Allowed slowdown as a fraction, e.g. 0.25 for 25%%.")
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name in benchmarks.BENCHMARKS:
+                self.stdout.write(name)
+            return
+
+        database = options['database'] or settings.MONGODB_NAME
+        if not options['database']:
+            try:
+                benchmarks.check_database(database)
+            except benchmarks.UnsafeDatabase as e:
+                raise CommandError(str(e))
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read baseline: {e}")
+
+        if settings.DEBUG:
+            self.stdout.write(self.style.WARNING("DEBUG is on; timings will be slower than in production."))
+
+        def progress(name, result):
+            if 'skipped' in result:
+                self.stdout.write(f"{name:32} skipped: {result['skipped']}")
+                return
+            line = (
+                f"{name:32} {result['median_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+                f"mongo {result['mongo_queries']:3}  sql {result['sql_queries']:3}"
+            )
+            if 'peak_kb' in result:
+                line += f"  peak {result['peak_kb']} KB"
+            self.stdout.write(line)
+            for run in result.get('sizes', ()):
+                self.stdout.write('    ' + '  '.join(f"{metric} {value}" for metric, value in run.items()))
+
+        # The per-request query log lines would drown the output
+        query_log = logging.getLogger('invoice.queries')
+        level = query_log.level
+        query_log.setLevel(logging.WARNING)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], MONGODB_NAME=database):
+                # Documents drop their cached collections on disconnect
+                disconnect_all()
+                mongo.register_connections()
+                try:
+                    report = benchmarks.run(
+                        options['only'], options['repeat'], options['warmup'], progress, any_database=True,
+                    )
+                finally:
+                    disconnect_all()
+            mongo.register_connections()
+        finally:
+            query_log.setLevel(level)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Report written to {options['output']}.")
+
+        if baseline is not None:
+            regressions = benchmarks.compare(report, baseline, options['tolerance'])
+            for name, metric, before, after in regressions:
+                self.stderr.write(f"{name}: {metric} {before} -> {after}")
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}.")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
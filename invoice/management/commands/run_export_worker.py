@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from invoice.exports import claim_next_job, expire_exports, requeue_stale_jobs, run_export_job
+
+# Seconds between sweeps for stale jobs and expired archives while idle
+MAINTENANCE_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued bulk export jobs, writing each archive under MEDIA_ROOT/exports/. Jobs left "
+        "running by a dead worker are queued again and archives older than EXPORT_FILE_TTL are deleted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Waiting for export jobs...")
+        self.maintain()
+        maintained = time.monotonic()
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                if time.monotonic() - maintained >= MAINTENANCE_INTERVAL:
+                    self.maintain()
+                    maintained = time.monotonic()
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Exporting {job.total} {job.kind} (job {job.pk}, attempt {job.attempts})")
+            started = time.monotonic()
+            if run_export_job(job):
+                self.stdout.write(self.style.SUCCESS(f"Job {job.pk} done in {time.monotonic() - started:.1f}s"))
+            else:
+                self.stdout.write(self.style.ERROR(f"Job {job.pk} failed"))
+
+    def maintain(self):
+        requeued, failed = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Queued {requeued} stale job(s) again"))
+        if failed:
+            self.stdout.write(self.style.ERROR(f"Failed {failed} job(s) that stopped their worker too often"))
+        expired = expire_exports()
+        if expired:
+            self.stdout.write(f"Deleted {expired} expired export(s)")
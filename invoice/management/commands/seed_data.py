@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice import seeding
+
+
+def item_range(value):
+    low, _, high = value.partition('-')
+    try:
+        low, high = int(low), int(high or low)
+    except ValueError:
+        raise CommandError(f"--items must look like 3 or 1-8, not {value!r}")
+    if not 1 <= low <= high:
+        raise CommandError("--items must be at least 1")
+    return low, high
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic vendors, invoices, purchase orders and users for benchmarks and load tests. "
+        "Point MONGODB_NAME at a scratch database first; --flush removes only previously seeded data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendors', type=int, default=20)
+        parser.add_argument('--invoices', type=int, default=5000)
+        parser.add_argument('--items', default='1-8', help="Line items per document, e.g. 5 or 1-8.")
+        parser.add_argument('--purchase-orders', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--days', type=int, default=730, help="Spread document dates over this many days.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives the same data.")
+        parser.add_argument('--password', help="Password for the seeded users (default: unusable).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--flush', action='store_true', help="Delete previously seeded data first.")
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive')
+
+    def handle(self, *args, **options):
+        items = item_range(options['items'])
+
+        if options['flush']:
+            if options['interactive']:
+                answer = input(f"Delete all seeded vendors, their documents and bench- users from {settings.MONGODB_NAME}? [y/N] ")
+                if answer.lower() not in ('y', 'yes'):
+                    raise CommandError("Flush cancelled.")
+            deleted = seeding.flush()
+            self.stdout.write(', '.join(f"{count} {name}" for name, count in deleted.items()) + " deleted.")
+
+        def progress(result):
+            self.stdout.write(
+                f"{result.vendors} vendors, {result.invoices} invoices ({result.line_items} lines), "
+                f"{result.purchase_orders} purchase orders"
+            )
+
+        result = seeding.seed(
+            vendors=options['vendors'],
+            invoices=options['invoices'],
+            purchase_orders=options['purchase_orders'],
+            users=options['users'],
+            items=items,
+            days=options['days'],
+            seed=options['seed'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {result.vendors} vendors, {result.invoices} invoices ({result.line_items} line items), "
+            f"{result.purchase_orders} purchase orders and {result.users} users in {result.elapsed:.1f}s."
+        ))
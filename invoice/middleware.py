@@ -0,0 +1,76 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from .instrumentation import capture_queries
+
+logger = logging.getLogger('invoice.queries')
+
+
+class QueryInstrumentationMiddleware:
+    """Counts each request's Mongo commands and SQL queries.
+
+    Every request is logged to ``invoice.queries`` as one JSON line. With
+    INVOICE_SERVER_TIMING the totals are also sent as a ``Server-Timing``
+    header (shown in the browser's network panel), and INVOICE_QUERY_PANEL
+    appends a summary to HTML pages. Streaming responses are counted up to
+    the point the response is returned, not while their body is generated.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with capture_queries() as log:
+            response = self.get_response(request)
+        return self.report(request, response, log, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with capture_queries() as log:
+            response = await self.get_response(request)
+        return self.report(request, response, log, time.perf_counter() - started)
+
+    def report(self, request, response, log, elapsed):
+        summary = log.as_dict()
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'ms': round(elapsed * 1000, 2),
+            **summary,
+        }))
+        if settings.INVOICE_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'mongo;dur={summary["mongo"]["ms"]};desc="{summary["mongo"]["count"]} commands"',
+                f'sql;dur={summary["sql"]["ms"]};desc="{summary["sql"]["count"]} queries"',
+                f'total;dur={elapsed * 1000:.2f}',
+            ])
+        if settings.INVOICE_QUERY_PANEL and self._is_html_page(response):
+            panel = render_to_string('query_panel.html', {'log': log, 'summary': summary, 'ms': elapsed * 1000})
+            content = response.content.decode(response.charset)
+            index = content.rfind('</body>')
+            if index != -1:
+                response.content = content[:index] + panel + content[index:]
+                if response.has_header('Content-Length'):
+                    response['Content-Length'] = len(response.content)
+        return response
+
+    @staticmethod
+    def _is_html_page(response):
+        return (
+            not response.streaming
+            and response.status_code == 200
+            and response.get('Content-Type', '').startswith('text/html')
+        )
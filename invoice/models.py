@@ -4,6 +4,12 @@ import mongoengine as me
 from datetime import datetime
 from num2words import num2words
 from django.utils import timezone
+from django.core.cache import cache
+import time
+import base64
+from pymongo import UpdateOne
+from asgiref.sync import sync_to_async
+from . import async_db, rollups, search, sequences, totals
 
 class Vendor(me.Document):
     user_id = me.IntField(required=True)
@@ -24,10 +30,47 @@ class Vendor(me.Document):
         ('template2', 'Template 2'),
         ('template3', 'Template 3'),
     ])
+    search_keys = me.ListField(me.StringField())
+    # Bumped on every change; part of the rendered invoice cache keys
+    revision = me.IntField(default=0)
+
+    meta = {
+        'indexes': ['user_id', 'name', 'search_keys'],
+    }
 
     def __str__(self):
         return self.name
 
+    @property
+    def initials(self):
+        return "".join([name[0] for name in self.name.split()]).upper()
+
+    def save(self, *args, **kwargs):
+        self.search_keys = sorted(search.text_keys(self.name))
+        self.revision = (self.revision or 0) + 1
+        return super().save(*args, **kwargs)
+
+    def reindex_documents(self):
+        # Invoices and POs carry the vendor name in their search keys, so a
+        # rename has to be pushed down to them.
+        for document, number_field in ((Invoice, 'invoice_number'), (PurchaseOrder, 'po_number')):
+            operations = [
+                UpdateOne({'_id': doc.pk}, {'$set': {
+                    'search_keys': search.document_keys(getattr(doc, number_field), self.name),
+                    'search_text': search.document_text(getattr(doc, number_field), self.name),
+                }})
+                for doc in document.objects(vendor=self).only(number_field)
+            ]
+            if operations:
+                document._get_collection().bulk_write(operations, ordered=False)
+
+
+CLIENT_CACHE_VERSION_KEY = 'invoice:client:version'
+
+# Process-local copy of the client settings document (and its logo bytes),
+# valid while its version matches CLIENT_CACHE_VERSION_KEY in Django's cache.
+_client_cache = {}
+
 
 class Client(me.Document):
     company_name = me.StringField(max_length=255, default="My Company")
@@ -39,12 +82,103 @@ class Client(me.Document):
     def __str__(self):
         return self.company_name
 
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        Client.invalidate()
+        return result
+
     @classmethod
-    def load(cls):
+    def cache_version(cls):
+        # Shared through Django's cache so every worker sees a settings change.
+        # Seeded from the clock so a fresh key never matches a stale local copy.
+        version = cache.get(CLIENT_CACHE_VERSION_KEY)
+        if version is None:
+            cache.add(CLIENT_CACHE_VERSION_KEY, int(time.time() * 1000), timeout=None)
+            version = cache.get(CLIENT_CACHE_VERSION_KEY)
+        return version
+
+    @classmethod
+    def invalidate(cls):
+        try:
+            cache.incr(CLIENT_CACHE_VERSION_KEY)
+        except ValueError:
+            cache.set(CLIENT_CACHE_VERSION_KEY, int(time.time() * 1000), timeout=None)
+
+    @classmethod
+    def _cached_entry(cls):
+        version = cls.cache_version()
+        entry = _client_cache.get('entry')
+        if entry and entry['version'] == version:
+            return entry
         obj = cls.objects.first()
         if not obj:
             obj = cls().save()
-        return obj
+            version = cls.cache_version()
+        entry = _client_cache['entry'] = {'version': version, 'client': obj}
+        return entry
+
+    @classmethod
+    def load(cls):
+        return cls._cached_entry()['client']
+
+    @classmethod
+    def load_logo(cls):
+        """Return ``(bytes, content_type)`` for the client logo, or ``(None, None)``."""
+        return cls._entry_logo(cls._cached_entry())
+
+    @classmethod
+    def load_logo_data_uri(cls):
+        return cls._entry_data_uri(cls._cached_entry())
+
+    @classmethod
+    async def _acached_entry(cls):
+        # The version check stays a plain cache lookup, cheaper than a thread hop
+        version = cls.cache_version()
+        entry = _client_cache.get('entry')
+        if entry and entry['version'] == version:
+            return entry
+        son = await async_db.collection(cls).find_one()
+        if son is None:
+            # Only before the settings are first saved: let load() create them
+            return await sync_to_async(cls._cached_entry)()
+        entry = _client_cache['entry'] = {'version': version, 'client': cls._from_son(son)}
+        return entry
+
+    @classmethod
+    async def aload(cls):
+        return (await cls._acached_entry())['client']
+
+    @classmethod
+    async def aload_logo_data_uri(cls):
+        entry = await cls._acached_entry()
+        if 'logo' not in entry:
+            client = entry['client']
+            logo = (None, None)
+            if client.logo and client.logo.grid_id:
+                logo = await async_db.read_file(client.logo.grid_id, client.logo.collection_name)
+            entry['logo'] = logo
+        return cls._entry_data_uri(entry)
+
+    @classmethod
+    def _entry_data_uri(cls, entry):
+        # Encoded once per logo version rather than on every render
+        if 'logo_data_uri' not in entry:
+            logo, content_type = cls._entry_logo(entry)
+            data_uri = None
+            if logo:
+                data_uri = f"data:{content_type or 'image/png'};base64,{base64.b64encode(logo).decode('ascii')}"
+            entry['logo_data_uri'] = data_uri
+        return entry['logo_data_uri']
+
+    @staticmethod
+    def _entry_logo(entry):
+        if 'logo' not in entry:
+            client = entry['client']
+            logo = (None, None)
+            if client.logo and client.logo.grid_id:
+                logo = (client.logo.read(), client.logo.content_type)
+            entry['logo'] = logo
+        return entry['logo']
 
 
 from django.db.models.signals import post_save
@@ -68,17 +202,60 @@ class Profile(models.Model):
     def __str__(self):
         return f'{self.user.username} - {self.get_role_display()}'
 
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(user=instance)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot()
+
+    def _snapshot(self):
+        self._saved_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+    def changed_fields(self):
+        """Names of the fields modified since the profile was loaded or saved."""
+        saved = getattr(self, '_saved_values', None)
+        if saved is None:
+            return [field.name for field in self._meta.concrete_fields]
+        return [
+            field.name for field in self._meta.concrete_fields
+            if field.attname in saved and getattr(self, field.attname) != saved[field.attname]
+        ]
+
+
+def ensure_profile(user):
+    """The user's profile, created if it is missing. Safe to call repeatedly."""
+    profile, _ = Profile.objects.get_or_create(user=user)
+    user.profile = profile
+    return profile
+
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def sync_user_profile(sender, instance, created, raw=False, **kwargs):
+    # Every login saves the user (last_login), so this must not touch the
+    # profile unless there is something to write
+    if raw:
+        return
+    if created:
+        ensure_profile(instance)
+        return
+    # A profile edited through user.profile is saved along with its user
+    profile = instance._state.fields_cache.get('profile')
+    if profile is not None and profile.pk:
+        changed = profile.changed_fields()
+        if changed:
+            profile.save(update_fields=changed + ['updated_at'])
+
+def amount_in_words(amount):
     try:
-        instance.profile.save()
-    except Profile.DoesNotExist:
-        Profile.objects.create(user=instance)
+        # Assuming currency is Naira. The user's example used "Naira".
+        return f"{num2words(amount, to='currency', lang='en_NG').replace('naira', '').replace('(', '').title()} Naira Only"
+    except Exception:
+        return "" # num2words might not support en_NG fully for currency
+
 
 class InvoiceItem(me.EmbeddedDocument):
     description = me.StringField(required=True)
@@ -87,20 +264,42 @@ class InvoiceItem(me.EmbeddedDocument):
     discount = me.DecimalField(default=0.0, precision=2)
     tax = me.BooleanField(default=False)
 
+    @property
+    def figures(self):
+        return totals.line_figures(self.quantity, self.unit_price, self.discount, self.tax)
+
     @property
     def amount(self):
-        return self.quantity * float(self.unit_price)
+        return self.figures[0]
 
     @property
     def tax_amount(self):
-        if self.tax:
-            return self.amount * 0.075
-        return 0
+        return self.figures[1]
 
     @property
     def net_amount(self):
         # As per user's weird calculation
-        return self.amount - self.tax_amount - float(self.discount)
+        return self.figures[2]
+
+
+def last_issued_number(document, field, key):
+    # Only used to seed a numbering counter that does not exist yet
+    last = document.objects(**{f'{field}__startswith': f'{key}/'}).order_by(f'-{field}').only(field).first()
+    return int(getattr(last, field).split('/')[-1]) if last else 0
+
+
+def claim_number(document, field, prefix, number):
+    # A number given by hand moves its counter past it, so later
+    # generated numbers don't run into it
+    parsed = sequences.split_number(number, prefix)
+    if parsed:
+        key, value = parsed
+        sequences.raise_to(key, value, start=lambda: last_issued_number(document, field, key))
+
+
+# Bump whenever the totals formula changes so stored figures get recomputed.
+# 2: totals computed in Decimal by invoice.totals
+TOTALS_VERSION = 2
 
 
 class Invoice(me.Document):
@@ -110,46 +309,76 @@ class Invoice(me.Document):
     terms = me.StringField(default="Please pay within 30 days.")
     items = me.ListField(me.EmbeddedDocumentField(InvoiceItem))
 
-    @property
-    def sub_total(self):
-        return sum(item.net_amount for item in self.items)
-
-    @property
-    def discount_total(self):
-        return sum(float(item.discount) for item in self.items)
+    # Denormalized totals, maintained by save() / recompute_totals()
+    sub_total = me.FloatField(default=0.0)
+    discount_total = me.FloatField(default=0.0)
+    tax_total = me.FloatField(default=0.0)
+    total = me.FloatField(default=0.0)
+    total_in_words = me.StringField(default="")
+    totals_version = me.IntField(default=0)
+
+    search_keys = me.ListField(me.StringField())
+    search_text = me.StringField()
+    # Bumped on every save; part of the rendered invoice cache keys
+    revision = me.IntField(default=0)
+
+    meta = {
+        'indexes': [
+            # Keyset pagination order for invoice_list
+            ('-invoice_date', '-id'),
+            ('vendor', '-invoice_date'),
+            ('search_keys', '-invoice_date', '-id'),
+        ] + search.text_indexes(),
+    }
+
+    def compute_totals(self):
+        figures = totals.invoice_totals(self.items, exact=True)
+        return {
+            'sub_total': float(figures['sub_total']),
+            'discount_total': float(figures['discount_total']),
+            'tax_total': float(figures['tax_total']),
+            'total': float(figures['total']),
+            'total_in_words': amount_in_words(figures['total']),
+            'totals_version': TOTALS_VERSION,
+        }
+
+    def recompute_totals(self):
+        for field, value in self.compute_totals().items():
+            setattr(self, field, value)
 
     @property
-    def tax_total(self):
-        return sum(item.tax_amount for item in self.items)
+    def totals_stale(self):
+        return self.totals_version != TOTALS_VERSION
 
-    @property
-    def total(self):
-        # As per user's weird calculation
-        return self.sub_total - self.discount_total + self.tax_total
-
-    @property
-    def total_in_words(self):
-        try:
-            # Assuming currency is Naira. The user's example used "Naira".
-            return f"{num2words(self.total, to='currency', lang='en_NG').replace('naira', '').replace('(', '').title()} Naira Only"
-        except Exception:
-            return "" # num2words might not support en_NG fully for currency
+    def ensure_totals(self):
+        # Documents that predate the stored totals (or an older formula) are
+        # recomputed in memory until recompute_invoice_totals backfills them.
+        if self.totals_stale:
+            self.recompute_totals()
+        return self
 
     def save(self, *args, **kwargs):
         if not self.invoice_number:
             self.invoice_number = self._generate_invoice_number()
+        elif not self.pk or 'invoice_number' in self._get_changed_fields():
+            claim_number(Invoice, 'invoice_number', 'INV', self.invoice_number)
+        self.recompute_totals()
+        self.search_keys = search.document_keys(self.invoice_number, self.vendor.name)
+        self.search_text = search.document_text(self.invoice_number, self.vendor.name)
+        self.revision = (self.revision or 0) + 1
+        before = rollups.stored(self, rollups.INVOICE_FIELDS)
         super().save(*args, **kwargs)
+        rollups.record(rollups.invoice_contributions(before), rollups.invoice_contributions(self.to_mongo()))
+
+    def delete(self, *args, **kwargs):
+        before = rollups.stored(self, rollups.INVOICE_FIELDS)
+        super().delete(*args, **kwargs)
+        rollups.record(rollups.invoice_contributions(before), [])
 
     def _generate_invoice_number(self):
-        year = datetime.now().year
-        vendor_initials = "".join([name[0] for name in self.vendor.name.split()]).upper()
-        last_invoice = Invoice.objects(invoice_number__startswith=f'INV/{vendor_initials}/{year}/').order_by('-invoice_number').first()
-        if last_invoice:
-            last_number = int(last_invoice.invoice_number.split('/')[-1])
-            new_number = last_number + 1
-        else:
-            new_number = 1
-        return f'INV/{vendor_initials}/{year}/{new_number:04d}'
+        key = sequences.sequence_key('INV', self.vendor.initials, datetime.now().year)
+        new_number = sequences.next_value(key, start=lambda: last_issued_number(Invoice, 'invoice_number', key))
+        return f'{key}/{new_number:04d}'
 
 
 class PurchaseOrderItem(me.EmbeddedDocument):
@@ -159,18 +388,32 @@ class PurchaseOrderItem(me.EmbeddedDocument):
 
     @property
     def amount(self):
-        return self.quantity * float(self.unit_price)
+        return totals.line_figures(self.quantity, self.unit_price)[0]
 
 class PurchaseOrder(me.Document):
+    STATUS_CHOICES = ('open', 'closed')
+
     vendor = me.ReferenceField('Vendor', required=True)
     po_number = me.StringField(max_length=255, unique=True)
     po_date = me.DateTimeField(default=datetime.now)
     terms = me.StringField()
+    status = me.StringField(default='open', choices=STATUS_CHOICES)
     items = me.ListField(me.EmbeddedDocumentField(PurchaseOrderItem))
+    search_keys = me.ListField(me.StringField())
+    search_text = me.StringField()
+
+    meta = {
+        'indexes': [
+            # Keyset pagination order for po_list
+            ('-po_date', '-id'),
+            ('vendor', '-po_date'),
+            ('search_keys', '-po_date', '-id'),
+        ] + search.text_indexes(),
+    }
 
     @property
     def sub_total(self):
-        return sum(item.amount for item in self.items)
+        return totals.po_totals(self.items)['sub_total']
 
     @property
     def total(self):
@@ -179,11 +422,73 @@ class PurchaseOrder(me.Document):
     def save(self, *args, **kwargs):
         if not self.po_number:
             self.po_number = self._generate_po_number()
+        elif not self.pk or 'po_number' in self._get_changed_fields():
+            claim_number(PurchaseOrder, 'po_number', 'PO', self.po_number)
+        self.search_keys = search.document_keys(self.po_number, self.vendor.name)
+        self.search_text = search.document_text(self.po_number, self.vendor.name)
+        before = rollups.stored(self, rollups.PURCHASE_ORDER_FIELDS)
         super().save(*args, **kwargs)
+        rollups.record(rollups.purchase_order_contributions(before), rollups.purchase_order_contributions(self.to_mongo()))
+
+    def delete(self, *args, **kwargs):
+        before = rollups.stored(self, rollups.PURCHASE_ORDER_FIELDS)
+        super().delete(*args, **kwargs)
+        rollups.record(rollups.purchase_order_contributions(before), [])
 
     def _generate_po_number(self):
-        year = datetime.now().year
-        vendor_initials = "".join([name[0] for name in self.vendor.name.split()]).upper()
-        last_po = PurchaseOrder.objects(po_number__startswith=f'PO/{vendor_initials}/{year}/').order_by('-po_number').first()
-        new_number = int(last_po.po_number.split('/')[-1]) + 1 if last_po else 1
-        return f'PO/{vendor_initials}/{year}/{new_number:04d}'
+        key = sequences.sequence_key('PO', self.vendor.initials, datetime.now().year)
+        new_number = sequences.next_value(key, start=lambda: last_issued_number(PurchaseOrder, 'po_number', key))
+        return f'{key}/{new_number:04d}'
+
+
+class ExportJob(me.Document):
+    STATUS_CHOICES = ('queued', 'running', 'done', 'failed', 'expired')
+    KIND_CHOICES = ('invoices', 'purchase_orders')
+
+    kind = me.StringField(required=True, choices=KIND_CHOICES)
+    document_ids = me.ListField(me.StringField())
+    base_url = me.StringField()
+    logo_mode = me.StringField()
+    user_id = me.IntField(required=True)
+    status = me.StringField(default='queued', choices=STATUS_CHOICES)
+    processed = me.IntField(default=0)
+    total = me.IntField(default=0)
+    file_path = me.StringField()
+    error = me.StringField()
+    created_at = me.DateTimeField(default=datetime.now)
+    started_at = me.DateTimeField()
+    # Written with the progress; a running job whose worker died stops updating it
+    heartbeat_at = me.DateTimeField()
+    attempts = me.IntField(default=0)
+    finished_at = me.DateTimeField()
+
+    meta = {
+        'indexes': [('status', 'created_at'), 'user_id'],
+    }
+
+    @property
+    def progress(self):
+        if not self.total:
+            return 100 if self.status == 'done' else 0
+        return min(100, int(self.processed * 100 / self.total))
+
+    @property
+    def filename(self):
+        return f'{self.kind}.zip'
+
+
+class LogoThumbnail(me.Document):
+    # Resized copy of an uploaded logo, stored in the same GridFS bucket and
+    # keyed on the original file so a new upload never reuses old variants.
+    source_id = me.ObjectIdField(required=True)
+    size = me.IntField(required=True)
+    image = me.FileField(collection_name='images')
+
+    meta = {
+        'indexes': [{'fields': ('source_id', 'size'), 'unique': True}],
+    }
+
+    @classmethod
+    def purge(cls, source_id):
+        for thumbnail in cls.objects(source_id=source_id):
+            thumbnail.delete()
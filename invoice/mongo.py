@@ -0,0 +1,169 @@
+"""MongoDB connections, configured from the ``MONGODB_*`` settings.
+
+:func:`register_connections` runs from ``InvoiceConfig.ready()`` and only
+registers the connection settings with mongoengine; each client (and its
+pool) is created the first time a query needs it, so importing settings or
+running management commands that never touch Mongo opens no connections.
+
+Two aliases share the same server settings but have separate pools:
+
+* ``default`` reads and writes on the primary.
+* ``reads`` prefers secondaries. List, report and ledger queries go through
+  :func:`for_reads`, which keeps long scans off the primary and off the
+  pool that saves use. Those reads can lag a just-saved document slightly,
+  so never use it to read back a write.
+
+Every client reports its connection pool events to a :class:`PoolMetrics`
+listener; :func:`pool_snapshot` is served as JSON by the ``mongo_pools`` view.
+Its commands are counted per request by invoice.instrumentation.
+"""
+import threading
+
+import mongoengine
+from django.conf import settings
+from mongoengine.connection import DEFAULT_CONNECTION_NAME, get_db
+from pymongo import ReadPreference, monitoring
+
+from . import instrumentation
+
+DEFAULT_ALIAS = DEFAULT_CONNECTION_NAME
+READ_ALIAS = 'reads'
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool counters for one client, per server address."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+
+    def _pool(self, address):
+        pool = self._pools.get(address)
+        if pool is None:
+            pool = self._pools[address] = {
+                'max_pool_size': None,
+                'open': 0,
+                'checked_out': 0,
+                'checkouts': 0,
+                'checkout_failures': 0,
+                'wait_seconds_total': 0.0,
+                'wait_seconds_max': 0.0,
+                'cleared': 0,
+            }
+        return pool
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)['max_pool_size'] = event.options.get('maxPoolSize')
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event.address)['cleared'] += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop(event.address, None)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event.address)['open'] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._pool(event.address)['open'] -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool['checkout_failures'] += 1
+            self._waited(pool, event.duration)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool['checked_out'] += 1
+            pool['checkouts'] += 1
+            self._waited(pool, event.duration)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._pool(event.address)['checked_out'] -= 1
+
+    @staticmethod
+    def _waited(pool, seconds):
+        pool['wait_seconds_total'] += seconds
+        pool['wait_seconds_max'] = max(pool['wait_seconds_max'], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            pools = {f'{host}:{port}': dict(pool) for (host, port), pool in self._pools.items()}
+        for pool in pools.values():
+            attempts = pool['checkouts'] + pool['checkout_failures']
+            pool['wait_seconds_mean'] = pool['wait_seconds_total'] / attempts if attempts else 0.0
+        return pools
+
+
+# One listener per client, by name: the two mongoengine aliases, and the
+# asyncio clients (one per event loop) under 'async'
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def pool_metrics(name):
+    with _metrics_lock:
+        metrics = _metrics.get(name)
+        if metrics is None:
+            metrics = _metrics[name] = PoolMetrics()
+        return metrics
+
+
+def pool_snapshot():
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    return {name: listener.snapshot() for name, listener in metrics.items()}
+
+
+def client_options(name, **options):
+    """Keyword arguments for a ``MongoClient``/``AsyncMongoClient`` named ``name`` in the metrics."""
+    options = {
+        'maxPoolSize': settings.MONGODB_MAX_POOL_SIZE,
+        'minPoolSize': settings.MONGODB_MIN_POOL_SIZE,
+        'waitQueueTimeoutMS': settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        'event_listeners': [pool_metrics(name), instrumentation.command_listener],
+        **options,
+    }
+    if settings.MONGODB_COMPRESSORS:
+        options['compressors'] = settings.MONGODB_COMPRESSORS
+    return options
+
+
+def register_connections():
+    for alias, read_preference in (
+        (DEFAULT_ALIAS, ReadPreference.PRIMARY),
+        (READ_ALIAS, ReadPreference.SECONDARY_PREFERRED),
+    ):
+        mongoengine.register_connection(
+            alias,
+            db=settings.MONGODB_NAME,
+            host=settings.MONGODB_HOST,
+            port=settings.MONGODB_PORT,
+            read_preference=read_preference,
+            **client_options(alias),
+        )
+
+
+def for_reads(queryset):
+    """``queryset`` evaluated on the secondary-preferred connection."""
+    # Not QuerySet.using(): that re-runs ensure_indexes on every call
+    collection = get_db(READ_ALIAS)[queryset._document._get_collection_name()]
+    return queryset._clone_into(queryset.__class__(queryset._document, collection))
@@ -0,0 +1,110 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from mongoengine.queryset.visitor import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, value, pk):
+    payload = json.dumps([direction, value.isoformat(), str(pk)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, value, pk = json.loads(payload)
+        if direction not in ('next', 'prev'):
+            raise InvalidCursor(token)
+        return direction, datetime.fromisoformat(value), ObjectId(pk)
+    except (ValueError, TypeError, binascii.Error, InvalidId):
+        raise InvalidCursor(token)
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Cursor pagination over ``(date_field, _id)``, newest first.
+
+    Unlike Django's Paginator this never counts the filtered collection and
+    never skips: every page is a range scan starting at the cursor, so page
+    5000 costs the same as page 1. Cursors are opaque url-safe tokens.
+    """
+
+    def __init__(self, queryset, date_field, per_page=10, approximate_count=False):
+        self.queryset = queryset
+        self.date_field = date_field
+        self.per_page = per_page
+        self.approximate_count = approximate_count
+
+    def window(self, cursor=None):
+        """Return ``(direction, queryset)`` for the page at ``cursor``, unevaluated."""
+        field = self.date_field
+        if not cursor:
+            return 'next', self.queryset.order_by(f'-{field}', '-id')
+
+        direction, value, pk = decode_cursor(cursor)
+        if direction == 'next':
+            bound = Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk})
+            return direction, self.queryset.filter(bound).order_by(f'-{field}', '-id')
+        bound = Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': pk})
+        return direction, self.queryset.filter(bound).order_by(field, 'id')
+
+    def page(self, cursor=None):
+        direction, queryset = self.window(cursor)
+        rows = list(queryset.limit(self.per_page + 1))
+        return self.build_page(rows, direction, has_cursor=bool(cursor), count=self.count())
+
+    def build_page(self, rows, direction, has_cursor, count=None):
+        """Turn up to ``per_page + 1`` rows fetched from ``window()`` into a page."""
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'prev':
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, has_cursor
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            last = rows[-1]
+            next_cursor = encode_cursor('next', getattr(last, self.date_field), last.pk)
+        if rows and has_previous:
+            first = rows[0]
+            previous_cursor = encode_cursor('prev', getattr(first, self.date_field), first.pk)
+        return KeysetPage(rows, next_cursor, previous_cursor, count)
+
+    def count(self):
+        # estimated_document_count reads collection metadata, so it is only
+        # meaningful (and only requested) for unfiltered listings.
+        if not self.approximate_count:
+            return None
+        return self.queryset._collection.estimated_document_count()
@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Nothing in this module may touch models or settings at import time: it is
+# imported afresh by every spawned render worker.
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+class WeasyPrintBackend:
+    def render(self, html, base_url=None):
+        from weasyprint import HTML
+        return HTML(string=html, base_url=base_url).write_pdf()
+
+
+_worker_backends = {}
+
+
+def _render_in_worker(backend_path, html, base_url, timeout):
+    backend = _worker_backends.get(backend_path)
+    if backend is None:
+        backend = _worker_backends[backend_path] = import_string(backend_path)()
+    if not timeout or not hasattr(signal, 'SIGALRM'):
+        return backend.render(html, base_url)
+
+    def expired(signum, frame):
+        raise RenderTimeout(f"PDF rendering took longer than {timeout}s")
+
+    previous = signal.signal(signal.SIGALRM, expired)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return backend.render(html, base_url)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class PDFEngine:
+    """Renders HTML to PDF with a pluggable backend on a pool of worker processes.
+
+    ``workers=0`` renders inline in the calling process (no timeout).
+    """
+
+    def __init__(self, backend_path, workers, timeout=None):
+        self.backend_path = backend_path
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: the web process has threads and open Mongo sockets
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _discard_executor(self, broken):
+        # A crashed worker breaks the whole pool; start a fresh one next time
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def _submit(self, html, base_url):
+        executor = self._get_executor()
+        return executor, executor.submit(_render_in_worker, self.backend_path, html, base_url, self.timeout)
+
+    def render(self, html, base_url=None):
+        if not self.workers:
+            return _render_in_worker(self.backend_path, html, base_url, None)
+        executor, future = self._submit(html, base_url)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise
+
+    def render_many(self, jobs):
+        """Render ``(key, html, base_url)`` jobs, yielding ``(key, pdf_bytes)`` as each finishes.
+
+        A failed document yields its exception instead of bytes. At most two
+        jobs per worker are in flight, so the HTML for a large selection is
+        never all in memory at once.
+        """
+        if not self.workers:
+            for key, html, base_url in jobs:
+                try:
+                    yield key, _render_in_worker(self.backend_path, html, base_url, None)
+                except Exception as exc:
+                    yield key, exc
+            return
+
+        jobs = iter(jobs)
+        pending = {}
+
+        def submit_next():
+            job = next(jobs, None)
+            if job is not None:
+                key, html, base_url = job
+                executor, future = self._submit(html, base_url)
+                pending[future] = (key, executor)
+
+        for _ in range(self.workers * 2):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, executor = pending.pop(future)
+                try:
+                    result = future.result()
+                except BrokenProcessPool as exc:
+                    self._discard_executor(executor)
+                    result = exc
+                except Exception as exc:
+                    result = exc
+                yield key, result
+                submit_next()
+
+
+_engine = None
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = PDFEngine(
+            getattr(settings, 'INVOICE_PDF_BACKEND', 'invoice.pdf.WeasyPrintBackend'),
+            getattr(settings, 'INVOICE_PDF_WORKERS', os.cpu_count() or 1),
+            getattr(settings, 'INVOICE_PDF_TIMEOUT', 60),
+        )
+    return _engine
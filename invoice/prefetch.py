@@ -0,0 +1,29 @@
+from bson import DBRef, ObjectId
+
+from .models import Vendor
+
+
+def _reference_id(value):
+    if isinstance(value, DBRef):
+        return value.id
+    if isinstance(value, ObjectId):
+        return value
+    return None
+
+
+def prefetch_vendors(documents, field='vendor'):
+    """Resolve ``field`` on every document with a single ``$in`` query.
+
+    Mongoengine dereferences a ReferenceField lazily on first access, so a
+    page of N documents costs N extra round trips. Reading the raw reference
+    out of ``_data`` and attaching the fetched vendors avoids that.
+    """
+    documents = list(documents)
+    vendor_ids = {_reference_id(doc._data.get(field)) for doc in documents}
+    vendor_ids.discard(None)
+    vendors = Vendor.objects.in_bulk(list(vendor_ids)) if vendor_ids else {}
+    for doc in documents:
+        vendor_id = _reference_id(doc._data.get(field))
+        if vendor_id in vendors:
+            doc._data[field] = vendors[vendor_id]
+    return documents
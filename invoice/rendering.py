@@ -0,0 +1,85 @@
+"""Rendered invoice pages, cached per document version.
+
+``invoice_detail.html`` and ``invoice_print.html`` depend only on the
+invoice, its vendor and the client settings, not on the request, so the
+rendered HTML is shared by every user and by the bulk exports. It is cached
+under a key made of the invoice and vendor ids, their ``revision`` counters
+(bumped on every save) and the client settings version. An edit therefore
+never has to find and delete entries: the next render uses a new key, and
+the old entries expire after INVOICE_RENDER_CACHE_TIMEOUT.
+
+The print preview inlines the client logo, so its entries are the ones an
+export with the logo embedded writes; when there is no client logo, every
+export mode shares them.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .models import Client, TOTALS_VERSION
+
+# Bump whenever the invoice templates change, so a shared cache stops
+# serving the old markup after a deploy
+RENDER_VERSION = 1
+
+
+def _logo_kind(logo_src):
+    # The logo itself is covered by the client version; what differs between
+    # renders is whether it is inlined, linked to a file in the archive, or absent
+    if not logo_src:
+        return 'none'
+    return 'inline' if logo_src.startswith('data:') else 'file'
+
+
+def _key(template, invoice, logo_src, client_version):
+    vendor = invoice.vendor
+    return ':'.join(str(part) for part in (
+        'invoice:render', RENDER_VERSION, TOTALS_VERSION, template, _logo_kind(logo_src),
+        invoice.pk, invoice.revision, vendor.pk, vendor.revision, client_version,
+    ))
+
+
+def cache_key(template, invoice, logo_src=None):
+    return _key(template, invoice, logo_src, Client.cache_version())
+
+
+def _render(template, invoice, client, logo_src):
+    invoice.ensure_totals()
+    return render_to_string(template, {'invoice': invoice, 'client': client, 'logo_src': logo_src})
+
+
+def render_invoice(template, invoice, client, logo_src=None):
+    key = cache_key(template, invoice, logo_src)
+    html = cache.get(key)
+    if html is None:
+        html = _render(template, invoice, client, logo_src)
+        cache.set(key, html, settings.INVOICE_RENDER_CACHE_TIMEOUT)
+    return html
+
+
+async def arender_invoice(template, invoice, client, logo_src=None):
+    key = cache_key(template, invoice, logo_src)
+    html = await cache.aget(key)
+    if html is None:
+        html = _render(template, invoice, client, logo_src)
+        await cache.aset(key, html, settings.INVOICE_RENDER_CACHE_TIMEOUT)
+    return html
+
+
+def render_invoices(template, invoices, client, logo_src=None, batch_size=100):
+    """Yield ``(invoice, html)`` for each of ``invoices``, one cache round trip per batch."""
+    invoices = iter(invoices)
+    client_version = Client.cache_version()
+    while batch := list(islice(invoices, batch_size)):
+        keys = [_key(template, invoice, logo_src, client_version) for invoice in batch]
+        cached = cache.get_many(keys)
+        rendered = {}
+        for invoice, key in zip(batch, keys):
+            html = cached.get(key)
+            if html is None:
+                html = rendered[key] = _render(template, invoice, client, logo_src)
+            yield invoice, html
+        if rendered:
+            cache.set_many(rendered, settings.INVOICE_RENDER_CACHE_TIMEOUT)
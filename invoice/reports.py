@@ -0,0 +1,98 @@
+from . import mongo
+from .filters import date_range
+from .models import Invoice, Vendor
+from .totals import TAX_RATE
+
+PERIOD_FORMATS = {
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+    'year': '%Y',
+}
+
+
+def vendor_period_pipeline(period='month', start=None, end=None, vendor_ids=None):
+    """Aggregation over ``invoices`` grouping line-item figures by vendor and period.
+
+    Decimal fields are stored as doubles, so the arithmetic runs directly on
+    them. The figures follow invoice.totals: amount = quantity * unit price, tax =
+    7.5% of taxed amounts, net = amount - tax - discount, and the invoice
+    total = net - discount + tax.
+    """
+    match = {}
+    bounds = date_range(start, end)
+    if bounds:
+        match['invoice_date'] = bounds
+    if vendor_ids:
+        match['vendor'] = {'$in': list(vendor_ids)}
+
+    return [
+        {'$match': match},
+        {'$project': {
+            'vendor': 1,
+            'items': 1,
+            'period': {'$dateToString': {'format': PERIOD_FORMATS[period], 'date': '$invoice_date'}},
+        }},
+        {'$unwind': {'path': '$items', 'preserveNullAndEmptyArrays': True}},
+        {'$project': {
+            'vendor': 1,
+            'period': 1,
+            'amount': {'$multiply': [
+                {'$ifNull': ['$items.quantity', 0]},
+                {'$ifNull': ['$items.unit_price', 0]},
+            ]},
+            'discount': {'$ifNull': ['$items.discount', 0]},
+            'taxed': {'$ifNull': ['$items.tax', False]},
+        }},
+        {'$addFields': {'tax': {'$cond': ['$taxed', {'$multiply': ['$amount', TAX_RATE]}, 0]}}},
+        # One row per invoice first, so invoices can be counted without $addToSet
+        {'$group': {
+            '_id': {'vendor': '$vendor', 'period': '$period', 'invoice': '$_id'},
+            'amount': {'$sum': '$amount'},
+            'discount': {'$sum': '$discount'},
+            'tax': {'$sum': '$tax'},
+        }},
+        {'$group': {
+            '_id': {'vendor': '$_id.vendor', 'period': '$_id.period'},
+            'invoices': {'$sum': 1},
+            'amount': {'$sum': '$amount'},
+            'discount': {'$sum': '$discount'},
+            'tax': {'$sum': '$tax'},
+        }},
+        {'$addFields': {'net': {'$subtract': [{'$subtract': ['$amount', '$tax']}, '$discount']}}},
+        {'$addFields': {'total': {'$add': [{'$subtract': ['$net', '$discount']}, '$tax']}}},
+        {'$sort': {'_id.period': 1, 'total': -1}},
+    ]
+
+
+def revenue_by_vendor(period='month', start=None, end=None, vendor_ids=None, queryset=None):
+    """Rows of ``{vendor_id, vendor, period, invoices, amount, discount, tax, net, total}``."""
+    queryset = queryset if queryset is not None else mongo.for_reads(Invoice.objects)
+    pipeline = vendor_period_pipeline(period, start, end, vendor_ids)
+    rows = list(queryset.aggregate(pipeline, allowDiskUse=True))
+
+    vendor_names = {
+        vendor.pk: vendor.name
+        for vendor in Vendor.objects(pk__in=list({row['_id']['vendor'] for row in rows})).only('name')
+    }
+    return [
+        {
+            'vendor_id': str(row['_id']['vendor']),
+            'vendor': vendor_names.get(row['_id']['vendor'], ''),
+            'period': row['_id']['period'],
+            'invoices': row['invoices'],
+            'amount': row['amount'],
+            'discount': row['discount'],
+            'tax': row['tax'],
+            'net': row['net'],
+            'total': row['total'],
+        }
+        for row in rows
+    ]
+
+
+def summarize(rows):
+    summary = {'invoices': 0, 'amount': 0, 'discount': 0, 'tax': 0, 'net': 0, 'total': 0}
+    for row in rows:
+        for key in summary:
+            summary[key] += row[key]
+    return summary
@@ -0,0 +1,101 @@
+"""Cached role lookups for ``roles_required`` and the templates.
+
+A user's role (and profile picture, which the navbar shows on every page)
+is read from SQLite once and kept in the cache under a per-user key; within
+a request it is also remembered on the user object, so the decorator, the
+context processor and views share one lookup. The entry is dropped whenever
+the profile or user is saved or deleted.
+
+:func:`permissions` turns the role into the map of what the user may do,
+computed once per request and exposed to templates as ``can``.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Profile
+
+# Roles allowed to do each thing; keep in step with the roles_required
+# arguments on the views
+PERMISSIONS = {
+    'view': ('admin', 'project_manager', 'accountant'),
+    'edit': ('admin', 'project_manager'),
+    'reports': ('admin', 'accountant'),
+    'admin': ('admin',),
+}
+
+NO_PROFILE = {'role': None, 'picture': ''}
+
+
+def cache_key(user_id):
+    return f'invoice:role:{user_id}'
+
+
+def _summary(row):
+    if row is None:
+        return NO_PROFILE
+    return {'role': row['role'], 'picture': row['profile_picture'] or ''}
+
+
+def _query(user):
+    return Profile.objects.filter(user_id=user.pk).values('role', 'profile_picture')
+
+
+def profile_summary(user):
+    """``{'role', 'picture'}`` for ``user``, from the request, the cache or SQLite."""
+    summary = getattr(user, '_role_summary', None)
+    if summary is None:
+        key = cache_key(user.pk)
+        summary = cache.get(key)
+        if summary is None:
+            summary = _summary(_query(user).first())
+            cache.set(key, summary, settings.INVOICE_ROLE_CACHE_TIMEOUT)
+        user._role_summary = summary
+    return summary
+
+
+async def aprofile_summary(user):
+    summary = getattr(user, '_role_summary', None)
+    if summary is None:
+        key = cache_key(user.pk)
+        summary = await cache.aget(key)
+        if summary is None:
+            summary = _summary(await _query(user).afirst())
+            await cache.aset(key, summary, settings.INVOICE_ROLE_CACHE_TIMEOUT)
+        user._role_summary = summary
+    return summary
+
+
+def get_role(user):
+    if not user.is_authenticated:
+        return None
+    return profile_summary(user)['role']
+
+
+def permissions(request):
+    perms = getattr(request, '_role_permissions', None)
+    if perms is None:
+        role = get_role(request.user)
+        perms = request._role_permissions = {name: role in roles for name, roles in PERMISSIONS.items()}
+    return perms
+
+
+def invalidate(user_id):
+    cache.delete(cache_key(user_id))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logging in only stamps last_login, which nothing here depends on
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    invalidate(instance.pk)
@@ -0,0 +1,188 @@
+"""Dashboard figures maintained incrementally as invoices and purchase orders change.
+
+Every rollup is a ``(count, total)`` pair keyed by kind and reference, e.g.
+invoices for one month or for one vendor. ``Invoice.save()``/``delete()`` and
+``PurchaseOrder.save()``/``delete()`` compare a document's contribution before
+and after the write and ``$inc`` only the difference, so the dashboard reads a
+handful of small documents instead of scanning invoices.
+
+Bulk writes that bypass ``save()`` must call :func:`record` themselves.
+``rebuild_rollups`` recomputes everything from scratch and ``check_rollups``
+reports drift against a full recompute.
+"""
+from datetime import datetime
+
+import mongoengine as me
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+
+from . import totals
+
+INVOICES = 'invoices'
+INVOICES_MONTH = 'invoices_month'
+INVOICES_VENDOR = 'invoices_vendor'
+PURCHASE_ORDERS = 'purchase_orders'
+PURCHASE_ORDERS_OPEN = 'purchase_orders_open'
+
+ALL = 'all'
+MONTH_FORMAT = '%Y-%m'
+
+# Fields each contribution is computed from; also the projection used to
+# read a document's stored state
+INVOICE_FIELDS = ('vendor', 'invoice_date', 'total')
+PURCHASE_ORDER_FIELDS = ('status', 'items')
+
+# Float totals accumulated through $inc may differ from a recompute in the
+# last few bits
+TOLERANCE = 0.005
+
+
+class Rollup(me.Document):
+    key = me.StringField(primary_key=True)
+    kind = me.StringField(required=True)
+    ref = me.StringField(required=True)
+    count = me.IntField(default=0)
+    total = me.FloatField(default=0.0)
+
+    meta = {
+        'collection': 'rollups',
+        'indexes': [('kind', '-total')],
+    }
+
+
+def rollup_key(kind, ref):
+    return f'{kind}:{ref}'
+
+
+def invoice_contributions(son):
+    """``[(kind, ref, total)]`` one stored invoice adds to the rollups."""
+    if not son:
+        return []
+    total = son.get('total') or 0.0
+    contributions = [(INVOICES, ALL, total)]
+    if son.get('invoice_date'):
+        contributions.append((INVOICES_MONTH, son['invoice_date'].strftime(MONTH_FORMAT), total))
+    if son.get('vendor'):
+        contributions.append((INVOICES_VENDOR, str(son['vendor']), total))
+    return contributions
+
+
+def purchase_order_contributions(son):
+    if not son:
+        return []
+    total = sum(
+        float(totals.line_figures(item.get('quantity') or 0, item.get('unit_price') or 0)[0])
+        for item in son.get('items') or []
+    )
+    contributions = [(PURCHASE_ORDERS, ALL, total)]
+    # Orders saved before the status field existed count as open
+    if son.get('status', 'open') == 'open':
+        contributions.append((PURCHASE_ORDERS_OPEN, ALL, total))
+    return contributions
+
+
+def stored(document, fields):
+    """The persisted state of ``document`` (``None`` if it was never saved)."""
+    if document.pk is None:
+        return None
+    return document._get_collection().find_one({'_id': document.pk}, {field: 1 for field in fields})
+
+
+def diff(before, after):
+    deltas = {}
+    for sign, contributions in ((-1, before), (1, after)):
+        for kind, ref, total in contributions:
+            delta = deltas.setdefault((kind, ref), [0, 0.0])
+            delta[0] += sign
+            delta[1] += sign * total
+    return {key: delta for key, delta in deltas.items() if delta[0] or abs(delta[1]) >= 1e-9}
+
+
+def record(before, after):
+    """Apply the change from ``before`` to ``after`` contributions."""
+    operations = [
+        UpdateOne(
+            {'_id': rollup_key(kind, ref)},
+            {'$inc': {'count': count, 'total': total}, '$setOnInsert': {'kind': kind, 'ref': ref}},
+            upsert=True,
+        )
+        for (kind, ref), (count, total) in diff(before, after).items()
+    ]
+    if operations:
+        Rollup._get_collection().bulk_write(operations, ordered=False)
+
+
+def compute(batch_size=1000):
+    """Rollups recomputed from every invoice and purchase order."""
+    # Imported here: models imports this module for save()/delete()
+    from .models import Invoice, PurchaseOrder
+
+    expected = {}
+    sources = (
+        (Invoice, INVOICE_FIELDS, invoice_contributions),
+        (PurchaseOrder, PURCHASE_ORDER_FIELDS, purchase_order_contributions),
+    )
+    for document, fields, contributions in sources:
+        cursor = document._get_collection().find({}, {field: 1 for field in fields}, batch_size=batch_size)
+        for son in cursor:
+            for kind, ref, total in contributions(son):
+                entry = expected.setdefault(rollup_key(kind, ref), {'kind': kind, 'ref': ref, 'count': 0, 'total': 0.0})
+                entry['count'] += 1
+                entry['total'] += total
+    return expected
+
+
+def rebuild(batch_size=1000):
+    """Replace the stored rollups with a full recompute; returns how many were written.
+
+    Writes that land while this runs may be lost from the result, so run it
+    while the app is quiet (or follow it with ``check_rollups``).
+    """
+    expected = compute(batch_size)
+    collection = Rollup._get_collection()
+    operations = [ReplaceOne({'_id': key}, dict(entry, _id=key), upsert=True) for key, entry in expected.items()]
+    for start in range(0, len(operations), batch_size):
+        collection.bulk_write(operations[start:start + batch_size], ordered=False)
+    collection.delete_many({'_id': {'$nin': list(expected)}})
+    return len(expected)
+
+
+def check(batch_size=1000):
+    """``[(key, expected, stored)]`` for every rollup that differs from a recompute."""
+    expected = compute(batch_size)
+    actual = {son['_id']: son for son in Rollup._get_collection().find()}
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key, {'count': 0, 'total': 0.0})
+        have = actual.get(key, {'count': 0, 'total': 0.0})
+        if want['count'] != have['count'] or abs(want['total'] - have['total']) > TOLERANCE:
+            mismatches.append((key, (want['count'], want['total']), (have['count'], have['total'])))
+    return mismatches
+
+
+def dashboard(today=None, top=5):
+    from .models import Vendor
+
+    today = today or datetime.now()
+    figures = {
+        'invoices': rollup_key(INVOICES, ALL),
+        'invoices_this_month': rollup_key(INVOICES_MONTH, today.strftime(MONTH_FORMAT)),
+        'purchase_orders': rollup_key(PURCHASE_ORDERS, ALL),
+        'open_purchase_orders': rollup_key(PURCHASE_ORDERS_OPEN, ALL),
+    }
+    rollups = Rollup.objects.in_bulk(list(figures.values()))
+    summary = {
+        name: {'count': rollups[key].count, 'total': rollups[key].total} if key in rollups else {'count': 0, 'total': 0.0}
+        for name, key in figures.items()
+    }
+
+    top_vendors = list(Rollup.objects(kind=INVOICES_VENDOR, count__gt=0).order_by('-total').limit(top))
+    vendors = Vendor.objects.only('name').in_bulk([ObjectId(rollup.ref) for rollup in top_vendors])
+    summary['top_vendors'] = [
+        {'vendor': vendors[ObjectId(rollup.ref)], 'count': rollup.count, 'total': rollup.total}
+        for rollup in top_vendors
+        # Rollups can outlive a deleted vendor
+        if ObjectId(rollup.ref) in vendors
+    ]
+    return summary
@@ -0,0 +1,89 @@
+import re
+
+from django.conf import settings
+from mongoengine.queryset.visitor import Q
+
+# Stored keys are the lowercase tokens of a document plus their edge n-grams
+# (prefixes), so both exact and prefix searches become multikey index hits.
+MIN_GRAM = 2
+MAX_GRAM = 20
+MAX_NUMBER_PREFIX = 32
+
+_SEPARATORS = re.compile(r'[^0-9a-z]+')
+
+
+def backend():
+    return getattr(settings, 'INVOICE_SEARCH_BACKEND', 'keys')
+
+
+def text_indexes(field='search_text'):
+    # The $text index is only declared when the text backend is switched on.
+    return [f'${field}'] if backend() == 'text' else []
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def tokenize(text):
+    return [token for token in _SEPARATORS.split(normalize(text)) if token]
+
+
+def edge_ngrams(token, limit=MAX_GRAM):
+    return {token[:n] for n in range(MIN_GRAM, min(len(token), limit) + 1)}
+
+
+def text_keys(text):
+    keys = set()
+    for token in tokenize(text):
+        keys.add(token[:MAX_GRAM])
+        keys.update(edge_ngrams(token))
+    return keys
+
+
+def number_keys(number):
+    # Numbers such as INV/ABC/2025/0001 are also searched as typed, separators
+    # included, so store the whole lowercase number and its prefixes as well.
+    normalized = normalize(number).replace(' ', '')
+    if not normalized:
+        return set()
+    keys = {normalized[:MAX_NUMBER_PREFIX]} | edge_ngrams(normalized, MAX_NUMBER_PREFIX)
+    return keys | text_keys(normalized)
+
+
+def document_keys(number, vendor_name):
+    return sorted(number_keys(number) | text_keys(vendor_name))
+
+
+def document_text(number, vendor_name):
+    return normalize(f'{number or ""} {vendor_name or ""}')
+
+
+def _key_clause(term, limit=MAX_GRAM):
+    if len(term) < MIN_GRAM:
+        # Single characters are not stored as keys; an anchored regex still walks the index
+        return Q(search_keys__startswith=term)
+    # Long terms were stored truncated, so match the truncated form exactly
+    return Q(search_keys=term[:limit])
+
+
+def plan(query):
+    """Build the Q for ``query`` against ``search_keys``; None when there is nothing to match."""
+    whole = normalize(query).replace(' ', '')
+    tokens = tokenize(query)
+    if not tokens:
+        return None
+
+    token_clause = _key_clause(tokens[0])
+    for token in tokens[1:]:
+        token_clause &= _key_clause(token)
+    if len(tokens) == 1 and tokens[0] == whole:
+        return token_clause
+    return _key_clause(whole, MAX_NUMBER_PREFIX) | token_clause
+
+
+def search(queryset, query):
+    if backend() == 'text':
+        return queryset.search_text(query)
+    clause = plan(query)
+    return queryset.filter(clause) if clause else queryset
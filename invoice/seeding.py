@@ -0,0 +1,215 @@
+"""Synthetic vendors, invoices, purchase orders and users.
+
+Used by ``seed_data`` and ``run_benchmarks`` to build a dataset of a chosen
+size against the configured MongoDB. Documents are generated from a seeded
+random number generator, so the same arguments give the same data, and are
+written in batches with ``insert_many``; numbers are reserved per vendor the
+way the importer does it. The dashboard rollups are rebuilt at the end
+rather than incremented per document.
+
+Seeded vendors have ``user_id`` SEEDED_USER_ID and seeded users are named
+``bench-…``; :func:`flush` removes exactly those, with every invoice and
+purchase order of the seeded vendors, and leaves real data alone.
+"""
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import rollups, search, sequences
+from .models import (
+    Invoice, InvoiceItem, Profile, PurchaseOrder, PurchaseOrderItem, Vendor, last_issued_number,
+)
+
+SEEDED_USER_ID = 0
+USER_PREFIX = 'bench-'
+
+NAME_WORDS = (
+    'Acme', 'Blue', 'Cedar', 'Delta', 'Eagle', 'Falcon', 'Granite', 'Harbor', 'Iron', 'Juniper',
+    'Keystone', 'Lakeside', 'Meridian', 'Northern', 'Orchid', 'Pioneer', 'Quarry', 'Summit',
+    'Redwood', 'Timber', 'Union', 'Valley', 'Willow', 'Zenith',
+)
+NAME_SUFFIXES = ('Supplies', 'Traders', 'Logistics', 'Works', 'Partners', 'Industries', 'Services')
+ITEM_WORDS = (
+    'Cement bags', 'Steel rods', 'Consulting hours', 'Site survey', 'Transport', 'Paint',
+    'Electrical cable', 'Office chairs', 'Printer toner', 'Safety boots', 'Timber planks', 'Labour',
+)
+CITIES = ('Lagos', 'Abuja', 'Kano', 'Ibadan', 'Enugu', 'Port Harcourt')
+
+
+class SeedResult:
+    def __init__(self):
+        self.vendors = 0
+        self.invoices = 0
+        self.line_items = 0
+        self.purchase_orders = 0
+        self.users = 0
+        self.elapsed = 0.0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def _vendor(rng, number):
+    name = f'{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {rng.choice(NAME_SUFFIXES)} {number}'
+    vendor = Vendor(
+        user_id=SEEDED_USER_ID,
+        name=name,
+        address=f'{rng.randint(1, 400)} Market Road',
+        city=rng.choice(CITIES),
+        state='Lagos',
+        phone_number=f'080{rng.randint(10000000, 99999999)}',
+        email=f'vendor{number}@example.com',
+        bank_name='Example Bank',
+        bank_account_name=name,
+        bank_account_number=str(rng.randint(10 ** 9, 10 ** 10 - 1)),
+        invoice_template=rng.choice(['template1', 'template2', 'template3']),
+    )
+    vendor.search_keys = sorted(search.text_keys(vendor.name))
+    return vendor
+
+
+def _date(rng, days):
+    return datetime.now().replace(microsecond=0) - timedelta(days=rng.uniform(0, days))
+
+
+def _number(documents, prefix, document, field):
+    """Give every document a number, one counter update per vendor."""
+    year = datetime.now().year
+    by_key = {}
+    for doc in documents:
+        by_key.setdefault(sequences.sequence_key(prefix, doc.vendor.initials, year), []).append(doc)
+    for key, numbered in by_key.items():
+        block = sequences.allocate(key, len(numbered), start=lambda key=key: last_issued_number(document, field, key))
+        for doc, number in zip(numbered, block):
+            setattr(doc, field, f'{key}/{number:04d}')
+
+
+def _insert(document, documents):
+    if documents:
+        document._get_collection().insert_many([doc.to_mongo() for doc in documents], ordered=False)
+
+
+def seed_invoices(rng, vendors, count, items=(1, 8), days=730, batch_size=1000, result=None):
+    for start in range(0, count, batch_size):
+        batch = []
+        for _ in range(min(batch_size, count - start)):
+            invoice = Invoice(
+                vendor=rng.choice(vendors),
+                invoice_date=_date(rng, days),
+                items=[
+                    InvoiceItem(
+                        description=rng.choice(ITEM_WORDS),
+                        quantity=rng.randint(1, 50),
+                        unit_price=round(rng.uniform(5, 5000), 2),
+                        discount=round(rng.choice([0, 0, 0, rng.uniform(0, 200)]), 2),
+                        tax=rng.random() < 0.6,
+                    )
+                    for _ in range(rng.randint(*items))
+                ],
+            )
+            batch.append(invoice)
+        _number(batch, 'INV', Invoice, 'invoice_number')
+        for invoice in batch:
+            invoice.recompute_totals()
+            invoice.search_keys = search.document_keys(invoice.invoice_number, invoice.vendor.name)
+            invoice.search_text = search.document_text(invoice.invoice_number, invoice.vendor.name)
+        _insert(Invoice, batch)
+        if result is not None:
+            result.invoices += len(batch)
+            result.line_items += sum(len(invoice.items) for invoice in batch)
+
+
+def seed_purchase_orders(rng, vendors, count, items=(1, 8), days=730, batch_size=1000, result=None):
+    for start in range(0, count, batch_size):
+        batch = [
+            PurchaseOrder(
+                vendor=rng.choice(vendors),
+                po_date=_date(rng, days),
+                terms='Delivery within 14 days.',
+                status='open' if rng.random() < 0.7 else 'closed',
+                items=[
+                    PurchaseOrderItem(
+                        description=rng.choice(ITEM_WORDS),
+                        quantity=rng.randint(1, 50),
+                        unit_price=round(rng.uniform(5, 5000), 2),
+                    )
+                    for _ in range(rng.randint(*items))
+                ],
+            )
+            for _ in range(min(batch_size, count - start))
+        ]
+        _number(batch, 'PO', PurchaseOrder, 'po_number')
+        for po in batch:
+            po.search_keys = search.document_keys(po.po_number, po.vendor.name)
+            po.search_text = search.document_text(po.po_number, po.vendor.name)
+        _insert(PurchaseOrder, batch)
+        if result is not None:
+            result.purchase_orders += len(batch)
+
+
+def seed_users(count, password=None):
+    """Create ``bench-user-N`` users (and profiles) that don't exist yet, cycling through the roles."""
+    roles = [role for role, _ in Profile.ROLE_CHOICES]
+    # Hashed once: every seeded user shares it
+    password = make_password(password)
+    wanted = {f'{USER_PREFIX}user-{number}': roles[number % len(roles)] for number in range(1, count + 1)}
+    existing = set(User.objects.filter(username__in=list(wanted)).values_list('username', flat=True))
+    users = [User(username=username, password=password) for username in wanted if username not in existing]
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        created = User.objects.filter(username__in=[user.username for user in users]).values_list('pk', 'username')
+        Profile.objects.bulk_create([Profile(user_id=pk, role=wanted[username]) for pk, username in created])
+    return len(users)
+
+
+def seed(vendors=20, invoices=5000, purchase_orders=2000, users=10, items=(1, 8), days=730,
+         seed=0, password=None, batch_size=1000, progress=None):
+    """Generate a dataset; returns a :class:`SeedResult`.
+
+    ``progress`` is called with the result after each stage.
+    """
+    rng = random.Random(seed)
+    result = SeedResult()
+    started = time.monotonic()
+
+    vendor_docs = [_vendor(rng, number) for number in range(1, vendors + 1)]
+    if vendor_docs:
+        Vendor.objects.insert(vendor_docs)
+    result.vendors = len(vendor_docs)
+    if progress:
+        progress(result)
+
+    if vendor_docs:
+        seed_invoices(rng, vendor_docs, invoices, items, days, batch_size, result)
+        if progress:
+            progress(result)
+        seed_purchase_orders(rng, vendor_docs, purchase_orders, items, days, batch_size, result)
+        if progress:
+            progress(result)
+
+    result.users = seed_users(users, password)
+    rollups.rebuild()
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+def seeded_vendors():
+    return Vendor.objects(user_id=SEEDED_USER_ID)
+
+
+def flush():
+    """Delete the seeded vendors, their invoices and purchase orders, and the seeded users."""
+    vendor_ids = list(seeded_vendors().scalar('id'))
+    deleted = {
+        # Queryset deletes skip Document.delete(), so the rollups are rebuilt below
+        'invoices': Invoice.objects(vendor__in=vendor_ids).delete(),
+        'purchase_orders': PurchaseOrder.objects(vendor__in=vendor_ids).delete(),
+        'vendors': seeded_vendors().delete(),
+        'users': User.objects.filter(username__startswith=USER_PREFIX).delete()[1].get('auth.User', 0),
+    }
+    rollups.rebuild()
+    return deleted
@@ -0,0 +1,76 @@
+import mongoengine as me
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+
+class Counter(me.Document):
+    id = me.StringField(primary_key=True)
+    seq = me.IntField(default=0)
+
+    meta = {'collection': 'counters'}
+
+
+# Keys whose counter document is known to exist in this process
+_seeded = set()
+
+
+def sequence_key(prefix, initials, year):
+    return f'{prefix}/{initials}/{year}'
+
+
+def split_number(number, prefix):
+    """``(key, value)`` for a number like ``INV/AW/2026/0050`` under ``prefix``, or None."""
+    key, _, value = (number or '').rpartition('/')
+    if key.startswith(f'{prefix}/') and key.count('/') == 2 and value.isdigit():
+        return key, int(value)
+    return None
+
+
+def _seed(key, start):
+    if key in _seeded:
+        return
+    collection = Counter._get_collection()
+    if collection.find_one({'_id': key}, {'_id': 1}) is None:
+        try:
+            collection.insert_one({'_id': key, 'seq': start()})
+        except DuplicateKeyError:
+            pass  # Another process seeded it first
+    _seeded.add(key)
+
+
+def allocate(key, count=1, start=None):
+    """Atomically reserve ``count`` consecutive numbers under ``key``.
+
+    ``start`` is called once, when the counter does not exist yet, to return
+    the last number already issued (so existing documents are not reused).
+    """
+    if start is not None:
+        _seed(key, start)
+    collection = Counter._get_collection()
+    try:
+        counter = collection.find_one_and_update(
+            {'_id': key}, {'$inc': {'seq': count}}, upsert=True, return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Two upserts raced to create the counter; the document exists now
+        counter = collection.find_one_and_update(
+            {'_id': key}, {'$inc': {'seq': count}}, return_document=ReturnDocument.AFTER,
+        )
+    last = counter['seq']
+    return range(last - count + 1, last + 1)
+
+
+def next_value(key, start=None):
+    return allocate(key, 1, start)[0]
+
+
+
+def raise_to(key, value, start=None):
+    """Make sure ``key`` never allocates ``value`` or anything below it.
+
+    For numbers issued outside the counter (typed in, or imported), which
+    it would otherwise reach and collide with.
+    """
+    if start is not None:
+        _seed(key, start)
+    Counter._get_collection().update_one({'_id': key}, {'$max': {'seq': value}}, upsert=True)
@@ -1,3 +1,327 @@
-from django.test import TestCase
+"""Tests for the invoice app.
 
-# Create your tests here.
+Tests that need MongoDB use :class:`MongoTestCase`: they run against a
+``test_<MONGODB_NAME>`` database on the configured server, which is dropped
+after every test, and are skipped when no server answers.
+"""
+import io
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from functools import cache as memoize
+from unittest import SkipTest, mock
+
+import pymongo
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from mongoengine.connection import disconnect_all, get_db
+from PIL import Image
+
+from . import exports, importers, logos, models, mongo, sequences, views
+from .instrumentation import capture_queries
+from .management.commands import check_indexes
+from .models import ExportJob, Invoice, InvoiceItem, PurchaseOrder, PurchaseOrderItem, Vendor
+
+
+@memoize
+def mongo_available():
+    client = pymongo.MongoClient(settings.MONGODB_HOST, settings.MONGODB_PORT, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+        return True
+    except pymongo.errors.PyMongoError:
+        return False
+    finally:
+        client.close()
+
+
+class MongoTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not mongo_available():
+            raise SkipTest(f"no MongoDB server at {settings.MONGODB_HOST}:{settings.MONGODB_PORT}")
+        super().setUpClass()
+        cls._mongo_settings = override_settings(MONGODB_NAME=f'test_{settings.MONGODB_NAME}')
+        cls._mongo_settings.enable()
+        # Documents drop their cached collections on disconnect
+        disconnect_all()
+        mongo.register_connections()
+
+    @classmethod
+    def tearDownClass(cls):
+        disconnect_all()
+        cls._mongo_settings.disable()
+        mongo.register_connections()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        models._client_cache.clear()
+        sequences._seeded.clear()
+
+    def tearDown(self):
+        db = get_db()
+        db.client.drop_database(db.name)
+
+    def make_vendor(self, name='Acme Works', **fields):
+        vendor = Vendor(user_id=1, name=name, address='1 Market Road', city='Lagos', state='Lagos',
+                        phone_number='08000000000', email='vendor@example.com', **fields)
+        vendor.save()
+        return vendor
+
+    def make_invoice(self, vendor, **fields):
+        invoice = Invoice(vendor=vendor, items=[InvoiceItem(description='Item', quantity=2, unit_price=10)], **fields)
+        invoice.save()
+        return invoice
+
+    def make_purchase_order(self, vendor, **fields):
+        po = PurchaseOrder(vendor=vendor, items=[PurchaseOrderItem(description='Item', quantity=2, unit_price=10)], **fields)
+        po.save()
+        return po
+
+    def login(self, role='accountant'):
+        user = User.objects.create_user('staff', password='password')
+        user.profile.role = role
+        user.save()
+        self.client.force_login(user)
+        return user
+
+
+def profile_queries(log):
+    return [sql for sql, _ in log.sql if 'invoice_profile' in sql]
+
+
+class ConcurrentNumberingTests(MongoTestCase):
+    THREADS = 8
+    PER_THREAD = 25
+
+    def save_concurrently(self, vendor):
+        numbers, errors = [], []
+        barrier = threading.Barrier(self.THREADS)
+
+        def create():
+            # Released together, so the first saves race to create the counter
+            barrier.wait()
+            try:
+                for _ in range(self.PER_THREAD):
+                    numbers.append(self.make_invoice(vendor).invoice_number)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=create) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return numbers
+
+    def test_concurrent_saves_get_unique_numbers(self):
+        vendor = self.make_vendor()
+        numbers = self.save_concurrently(vendor)
+
+        total = self.THREADS * self.PER_THREAD
+        self.assertEqual(len(set(numbers)), total)
+        self.assertEqual(Invoice.objects(vendor=vendor).count(), total)
+        self.assertEqual(sorted(int(number.rsplit('/', 1)[1]) for number in numbers), list(range(1, total + 1)))
+
+    def test_first_use_continues_after_existing_numbers(self):
+        vendor = self.make_vendor()
+        key = sequences.sequence_key('INV', vendor.initials, datetime.now().year)
+        # Issued before the counters collection existed: no counter yet
+        self.make_invoice(vendor, invoice_number=f'{key}/0007')
+
+        numbers = self.save_concurrently(vendor)
+
+        total = self.THREADS * self.PER_THREAD
+        self.assertEqual(sorted(int(number.rsplit('/', 1)[1]) for number in numbers), list(range(8, 8 + total)))
+
+
+class ManualNumberTests(MongoTestCase):
+    def test_generated_numbers_skip_a_number_given_by_hand(self):
+        vendor = self.make_vendor()
+        key = sequences.sequence_key('INV', vendor.initials, datetime.now().year)
+        self.make_invoice(vendor)
+        self.make_invoice(vendor, invoice_number=f'{key}/0050')
+
+        numbers = [self.make_invoice(vendor).invoice_number for _ in range(2)]
+        self.assertEqual(numbers, [f'{key}/0051', f'{key}/0052'])
+
+    def test_lower_number_given_by_hand_leaves_the_counter(self):
+        vendor = self.make_vendor()
+        key = sequences.sequence_key('PO', vendor.initials, datetime.now().year)
+        for _ in range(3):
+            self.make_purchase_order(vendor)
+        PurchaseOrder.objects.get(po_number=f'{key}/0002').delete()
+        self.make_purchase_order(vendor, po_number=f'{key}/0002')
+
+        self.assertEqual(self.make_purchase_order(vendor).po_number, f'{key}/0004')
+
+    def test_imported_numbers_are_skipped(self):
+        vendor = self.make_vendor()
+        key = sequences.sequence_key('INV', vendor.initials, datetime.now().year)
+        self.make_invoice(vendor)
+        data = (
+            'vendor,invoice_date,invoice_number,reference,description,quantity,unit_price\n'
+            f'{vendor.name},{date.today()},{key}/0020,a,Item,1,10\n'
+            f'{vendor.name},{date.today()},,b,Item,1,10\n'
+        )
+
+        result = importers.import_invoices(io.StringIO(data), 'csv')
+        self.assertEqual(result.errors, [])
+        self.assertEqual(
+            sorted(Invoice.objects(vendor=vendor).scalar('invoice_number')),
+            [f'{key}/0001', f'{key}/0020', f'{key}/0021'],
+        )
+        self.assertEqual(self.make_invoice(vendor).invoice_number, f'{key}/0022')
+
+
+class ListQueryTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.login()
+        vendors = [self.make_vendor(f'Vendor {number}') for number in range(20)]
+        for number in range(120):
+            self.make_invoice(vendors[number % len(vendors)])
+            self.make_purchase_order(vendors[number % len(vendors)])
+
+    def get_list(self, name, page_size):
+        with mock.patch.object(views, 'LIST_PAGE_SIZE', page_size), capture_queries() as log:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return response, log
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for name, rows in (('invoice_list', 'invoices'), ('po_list', 'purchase_orders')):
+            with self.subTest(name):
+                # Warms the role and client settings caches
+                self.get_list(name, 10)
+                small, small_log = self.get_list(name, 10)
+                large, large_log = self.get_list(name, 100)
+                self.assertEqual(len(small.context[rows].object_list), 10)
+                self.assertEqual(len(large.context[rows].object_list), 100)
+                self.assertEqual(large_log.mongo_count, small_log.mongo_count)
+                self.assertEqual(large_log.sql_count, small_log.sql_count)
+
+    def test_role_is_cached_after_first_request(self):
+        self.client.get(reverse('invoice_list'))
+        with capture_queries() as log:
+            response = self.client.get(reverse('invoice_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(profile_queries(log), [])
+
+
+class ListTotalsTests(MongoTestCase):
+    def test_list_computes_totals_stored_by_an_older_version(self):
+        self.login()
+        invoice = self.make_invoice(self.make_vendor())
+        # As saved before totals were stored on the document
+        Invoice._get_collection().update_one({'_id': invoice.pk}, {'$set': {'total': 0.0, 'totals_version': 0}})
+
+        response = self.client.get(reverse('invoice_list'))
+        [listed] = response.context['invoices'].object_list
+        self.assertEqual(listed.total, invoice.total)
+        self.assertContains(response, '₦20.00')
+
+
+class ExportJobTests(MongoTestCase):
+    def test_bulk_download_of_all_matching_documents_is_queued(self):
+        user = self.login()
+        vendor = self.make_vendor()
+        for _ in range(settings.EXPORT_SYNC_LIMIT + 1):
+            self.make_invoice(vendor)
+
+        response = self.client.post(reverse('invoice_bulk_download'), {'all_matching': '1', 'q': '', 'start': '', 'end': ''})
+        job = ExportJob.objects.get(user_id=user.id)
+        self.assertRedirects(response, reverse('export_status', args=[job.pk]), fetch_redirect_response=False)
+        self.assertEqual(job.total, settings.EXPORT_SYNC_LIMIT + 1)
+
+    def test_stale_running_job_is_queued_again_then_failed(self):
+        job = ExportJob(kind='invoices', user_id=1).save()
+        for attempt in range(1, settings.EXPORT_JOB_MAX_ATTEMPTS + 1):
+            self.assertEqual(exports.claim_next_job().pk, job.pk)
+            # The worker died without reporting progress
+            ExportJob.objects(pk=job.pk).update(set__heartbeat_at=datetime.now() - timedelta(hours=1))
+            exports.requeue_stale_jobs()
+            job.reload()
+            self.assertEqual(job.attempts, attempt)
+            expected = 'failed' if attempt == settings.EXPORT_JOB_MAX_ATTEMPTS else 'queued'
+            self.assertEqual(job.status, expected)
+
+    def test_running_job_reporting_progress_is_left_alone(self):
+        job = ExportJob(kind='invoices', user_id=1).save()
+        exports.claim_next_job()
+        self.assertEqual(exports.requeue_stale_jobs(), (0, 0))
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).status, 'running')
+
+    def test_old_archives_expire(self):
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            old = ExportJob(kind='invoices', user_id=1, status='done', finished_at=datetime.now() - timedelta(days=30)).save()
+            recent = ExportJob(kind='invoices', user_id=1, status='done', finished_at=datetime.now()).save()
+            for job in (old, recent):
+                exports.export_path(job).parent.mkdir(parents=True, exist_ok=True)
+                exports.export_path(job).write_bytes(b'PK')
+            # Left behind by a crashed worker
+            partial = Path(media) / 'exports' / 'crashed.part'
+            partial.write_bytes(b'PK')
+            month_ago = (datetime.now() - timedelta(days=30)).timestamp()
+            os.utime(partial, (month_ago, month_ago))
+            os.utime(exports.export_path(old), (month_ago, month_ago))
+
+            self.assertEqual(exports.expire_exports(), 1)
+            self.assertEqual(ExportJob.objects.get(pk=old.pk).status, 'expired')
+            self.assertFalse(exports.export_path(old).exists())
+            self.assertFalse(partial.exists())
+            self.assertEqual(ExportJob.objects.get(pk=recent.pk).status, 'done')
+            self.assertTrue(exports.export_path(recent).exists())
+
+
+class SearchIndexTests(MongoTestCase):
+    def test_list_and_search_queries_use_indexes(self):
+        for document in check_indexes.DOCUMENTS:
+            document.ensure_indexes()
+        vendor = self.make_vendor()
+        self.make_invoice(vendor)
+        self.make_purchase_order(vendor)
+
+        for label, queryset in check_indexes.list_queries():
+            with self.subTest(label):
+                stages = check_indexes._plan_stages(queryset.explain()['queryPlanner']['winningPlan'])
+                self.assertNotIn('COLLSCAN', stages)
+
+
+class LogoThumbnailTests(SimpleTestCase):
+    def image_bytes(self, mode, format):
+        buffer = io.BytesIO()
+        Image.new(mode, (300, 200)).save(buffer, format=format)
+        return buffer.getvalue()
+
+    def test_cmyk_logo_is_converted(self):
+        thumbnail = Image.open(io.BytesIO(logos._resize(self.image_bytes('CMYK', 'JPEG'), 64)))
+        self.assertEqual(thumbnail.format, 'PNG')
+        self.assertEqual(thumbnail.size, (64, 43))
+
+    def test_unreadable_logo_gives_none(self):
+        self.assertIsNone(logos._resize(b'not an image', 64))
+        self.assertIsNone(logos._resize(self.image_bytes('RGB', 'PNG')[:100], 64))
+
+
+class LoginQueryTests(TestCase):
+    # The user lookup, the session (checked, created, then rotated) and
+    # last_login; the profile is neither loaded nor saved
+    LOGIN_QUERIES = 5
+
+    def test_login_query_count(self):
+        User.objects.create_user('staff', password='password')
+        with capture_queries() as log:
+            response = self.client.post(reverse('login'), {'username': 'staff', 'password': 'password'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(profile_queries(log), [])
+        # Savepoints only appear because the test runs inside a transaction
+        queries = [sql for sql, _ in log.sql if 'SAVEPOINT' not in sql]
+        self.assertLessEqual(len(queries), self.LOGIN_QUERIES, queries)
@@ -0,0 +1,94 @@
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:  # NumPy only speeds up batch_invoice_totals; results are the same without it
+    np = None
+
+TAX_RATE = 0.075
+TAX_RATE_EXACT = Decimal('0.075')
+
+ZERO = Decimal(0)
+
+
+def _exact(value):
+    if value is None:
+        return ZERO
+    if isinstance(value, Decimal):
+        return value
+    # Through str() so a float quantity like 0.1 stays 0.1, not its binary expansion
+    return Decimal(str(value))
+
+
+def line_figures(quantity, unit_price, discount=0, tax=False, exact=False):
+    """Return ``(amount, tax_amount, net_amount)`` for one line item."""
+    if exact:
+        amount = _exact(quantity) * _exact(unit_price)
+        tax_amount = amount * TAX_RATE_EXACT if tax else ZERO
+        # As per user's weird calculation
+        return amount, tax_amount, amount - tax_amount - _exact(discount)
+    amount = quantity * float(unit_price)
+    tax_amount = amount * TAX_RATE if tax else 0
+    return amount, tax_amount, amount - tax_amount - float(discount or 0)
+
+
+def _summarize(sub_total, discount_total, tax_total):
+    return {
+        'sub_total': sub_total,
+        'discount_total': discount_total,
+        'tax_total': tax_total,
+        # As per user's weird calculation
+        'total': sub_total - discount_total + tax_total,
+    }
+
+
+def invoice_totals(items, exact=False):
+    zero = ZERO if exact else 0
+    sub_total = discount_total = tax_total = zero
+    for item in items:
+        _, tax_amount, net_amount = line_figures(item.quantity, item.unit_price, item.discount, item.tax, exact)
+        sub_total += net_amount
+        discount_total += _exact(item.discount) if exact else float(item.discount or 0)
+        tax_total += tax_amount
+    return _summarize(sub_total, discount_total, tax_total)
+
+
+def po_totals(items, exact=False):
+    sub_total = sum((line_figures(item.quantity, item.unit_price, exact=exact)[0] for item in items), ZERO if exact else 0)
+    return {'sub_total': sub_total, 'total': sub_total}
+
+
+def batch_invoice_totals(invoices, exact=False):
+    """Totals for many invoices at once, in the order given.
+
+    Line items are laid out as columns (quantity, unit price, discount, tax
+    flag, owning invoice) and computed in one vectorized pass when NumPy is
+    available. ``exact=True`` computes in Decimal instead, for money.
+    """
+    invoices = list(invoices)
+    if exact or np is None:
+        return [invoice_totals(invoice.items, exact) for invoice in invoices]
+
+    owners, quantity, unit_price, discount, taxed = [], [], [], [], []
+    for index, invoice in enumerate(invoices):
+        for item in invoice.items:
+            owners.append(index)
+            quantity.append(item.quantity)
+            unit_price.append(float(item.unit_price))
+            discount.append(float(item.discount or 0))
+            taxed.append(bool(item.tax))
+
+    owners = np.asarray(owners, dtype=np.intp)
+    discount = np.asarray(discount, dtype=np.float64)
+    amount = np.asarray(quantity, dtype=np.float64) * np.asarray(unit_price, dtype=np.float64)
+    tax_amount = np.where(np.asarray(taxed, dtype=bool), amount * TAX_RATE, 0.0)
+    net_amount = amount - tax_amount - discount
+
+    count = len(invoices)
+    sub_totals = np.bincount(owners, weights=net_amount, minlength=count)
+    discount_totals = np.bincount(owners, weights=discount, minlength=count)
+    tax_totals = np.bincount(owners, weights=tax_amount, minlength=count)
+    return [
+        _summarize(float(sub_total), float(discount_total), float(tax_total))
+        for sub_total, discount_total, tax_total in zip(sub_totals, discount_totals, tax_totals)
+    ]
@@ -1,7 +1,11 @@
+from django.conf import settings
 from django.urls import path, re_path
-from . import views
+from . import async_views, views
 from django.contrib.auth import views as auth_views
 
+# Read-heavy views are served by their async versions under ASGI
+read_views = async_views if settings.INVOICE_ASYNC_VIEWS else views
+
 urlpatterns = [
     path('', views.home, name='home'),
     path('signup/', views.signup, name='signup'),
@@ -14,7 +18,7 @@ urlpatterns = [
     re_path(r'^vendors/(?P<pk>[0-9a-f]{24})/$', views.vendor_detail, name='vendor_detail'),
     re_path(r'^vendors/(?P<pk>[0-9a-f]{24})/edit/$', views.vendor_update, name='vendor_update'),
     re_path(r'^vendors/(?P<pk>[0-9a-f]{24})/delete/$', views.vendor_delete, name='vendor_delete'),
-    re_path(r'^vendors/(?P<pk>[0-9a-f]{24})/logo/$', views.vendor_logo, name='vendor_logo'),
+    re_path(r'^vendors/(?P<pk>[0-9a-f]{24})/logo/$', read_views.vendor_logo, name='vendor_logo'),
 
     path('settings/', views.client_settings, name='client_settings'),
     path('users/', views.user_list, name='user_list'),
@@ -25,20 +29,35 @@ urlpatterns = [
     path('reset/<uidb64>/<token>/', auth_views.PasswordResetConfirmView.as_view(template_name='password_reset_confirm.html'), name='password_reset_confirm'),
     path('reset/done/', auth_views.PasswordResetCompleteView.as_view(template_name='password_reset_complete.html'), name='password_reset_complete'),
 
-    path('invoices/', views.invoice_list, name='invoice_list'),
+    path('invoices/', read_views.invoice_list, name='invoice_list'),
     path('invoices/new/', views.invoice_create, name='invoice_create'),
     path('invoices/bulk_download/', views.invoice_bulk_download, name='invoice_bulk_download'),
-    re_path(r'^invoices/(?P<pk>[0-9a-f]{24})/$', views.invoice_detail, name='invoice_detail'),
+    path('invoices/import/', views.invoice_import, name='invoice_import'),
+    path('invoices/ledger.csv', views.invoice_ledger, name='invoice_ledger'),
+    re_path(r'^invoices/(?P<pk>[0-9a-f]{24})/$', read_views.invoice_detail, name='invoice_detail'),
     re_path(r'^invoices/(?P<pk>[0-9a-f]{24})/edit/$', views.invoice_update, name='invoice_update'),
     re_path(r'^invoices/(?P<pk>[0-9a-f]{24})/delete/$', views.invoice_delete, name='invoice_delete'),
     re_path(r'^invoices/(?P<pk>[0-9a-f]{24})/print/$', views.invoice_print_preview, name='invoice_print_preview'),
 
     # Purchase Order URLs
-    path('purchase-orders/', views.po_list, name='po_list'),
+    path('purchase-orders/', read_views.po_list, name='po_list'),
     path('purchase-orders/new/', views.po_create, name='po_create'),
-    path('purchase-orders/<str:pk>/', views.po_detail, name='po_detail'),
+    path('purchase-orders/bulk_download/', views.po_bulk_download, name='po_bulk_download'),
+    path('purchase-orders/ledger.csv', views.po_ledger, name='po_ledger'),
+    path('purchase-orders/<str:pk>/', read_views.po_detail, name='po_detail'),
     path('purchase-orders/<str:pk>/edit/', views.po_update, name='po_update'),
     path('purchase-orders/<str:pk>/delete/', views.po_delete, name='po_delete'),
     path('purchase-orders/<str:pk>/download/', views.po_download, name='po_download'),
-    path('purchase-orders/bulk_download/', views.po_bulk_download, name='po_bulk_download'),
+
+    # Reports
+    path('reports/revenue/', views.report_revenue, name='report_revenue'),
+    path('reports/revenue.json', views.report_revenue_json, name='report_revenue_json'),
+
+    # Export jobs
+    re_path(r'^exports/(?P<pk>[0-9a-f]{24})/$', views.export_status, name='export_status'),
+    re_path(r'^exports/(?P<pk>[0-9a-f]{24})/status/$', views.export_status_json, name='export_status_json'),
+    re_path(r'^exports/(?P<pk>[0-9a-f]{24})/download/$', views.export_download, name='export_download'),
+
+    # Monitoring
+    path('monitoring/mongo-pools/', views.mongo_pools, name='mongo_pools'),
 ]
\ No newline at end of file
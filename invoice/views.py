@@ -1,21 +1,22 @@
 from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import login, logout
-from .models import Vendor, Client
+from .models import Vendor, Client, LogoThumbnail
 from .forms import VendorForm, ClientForm
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from django.core.files.base import ContentFile
 import io
 from .decorators import roles_required
+from .prefetch import prefetch_vendors
+from . import logos, mongo, roles, rollups
 
 def generate_logo(name):
     initials = ''.join([s[0] for s in name.split()])
     img = Image.new('RGB', (100, 100), color = (73, 109, 137))
     d = ImageDraw.Draw(img)
-    try:
-        font = ImageFont.truetype("arial.ttf", 40)
-    except IOError:
-        font = ImageFont.load_default()
+    font = logos.load_font(40)
     d.text((25,25), initials, fill=(255,255,0), font=font)
     buffer = io.BytesIO()
     img.save(buffer, format='PNG')
@@ -35,8 +36,8 @@ def signup(request):
     return render(request, 'signup.html', {'form': form})
 
 def home(request):
-    vendors = Vendor.objects.all()
-    return render(request, 'home.html', {'vendors': vendors})
+    dashboard = rollups.dashboard() if request.user.is_authenticated else None
+    return render(request, 'home.html', {'dashboard': dashboard})
 
 def login_view(request):
     if request.method == 'POST':
@@ -44,6 +45,10 @@ def login_view(request):
         if form.is_valid():
             user = form.get_user()
             login(request, user)
+            # Set by roles_required when it sends an anonymous user here
+            next_url = request.GET.get('next')
+            if next_url and url_has_allowed_host_and_scheme(next_url, {request.get_host()}, request.is_secure()):
+                return redirect(next_url)
             return redirect('home')  # Redirect to a home page after login
     else:
         form = AuthenticationForm()
@@ -54,7 +59,6 @@ def vendor_list(request):
     vendors = Vendor.objects.all()
     return render(request, 'vendor_list.html', {'vendors': vendors})
 
-import base64
 
 @roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
 def vendor_detail(request, pk):
@@ -86,9 +90,15 @@ def vendor_update(request, pk):
         if form.is_valid():
             data = form.cleaned_data
             if 'logo' in request.FILES:
+                if vendor.logo.grid_id:
+                    LogoThumbnail.purge(vendor.logo.grid_id)
                 vendor.logo.replace(request.FILES['logo'])
                 data.pop('logo')
-            vendor.update(**data)
+            renamed = data['name'] != vendor.name
+            vendor.update(search_keys=sorted(search.text_keys(data['name'])), inc__revision=1, **data)
+            if renamed:
+                vendor.reload()
+                vendor.reindex_documents()
             return redirect('vendor_list')
     else:
         form = VendorForm(initial=vendor.to_mongo().to_dict())
@@ -98,6 +108,8 @@ def vendor_update(request, pk):
 def vendor_delete(request, pk):
     vendor = Vendor.objects.get(pk=pk)
     if request.method == 'POST':
+        if vendor.logo and vendor.logo.grid_id:
+            LogoThumbnail.purge(vendor.logo.grid_id)
         vendor.delete()
         return redirect('vendor_list')
     return render(request, 'vendor_confirm_delete.html', {'vendor': vendor})
@@ -109,9 +121,6 @@ def logout_view(request):
 @roles_required(allowed_roles=['admin'])
 def client_settings(request):
     client = Client.load()
-    logo_data = None
-    if client.logo:
-        logo_data = base64.b64encode(client.logo.read()).decode('utf-8')
     if request.method == 'POST':
         form = ClientForm(request.POST, request.FILES)
         if form.is_valid():
@@ -124,26 +133,30 @@ def client_settings(request):
             return redirect('client_settings')
     else:
         form = ClientForm(initial=client.to_mongo().to_dict())
-    return render(request, 'client_settings.html', {'form': form, 'client': client, 'logo_data': logo_data})
+    return render(request, 'client_settings.html', {'form': form, 'client': client, 'logo_src': Client.load_logo_data_uri()})
 
 from django.contrib.auth.models import User
 from .forms import UserRoleForm
+from .models import ensure_profile
 
 @roles_required(allowed_roles=['admin'])
 def user_list(request):
-    users = User.objects.all()
+    users = User.objects.select_related('profile')
     return render(request, 'user_list.html', {'users': users})
 
 @roles_required(allowed_roles=['admin'])
 def user_edit_role(request, pk):
     user = get_object_or_404(User, pk=pk)
+    profile = ensure_profile(user)
     if request.method == 'POST':
-        form = UserRoleForm(request.POST, instance=user.profile)
+        form = UserRoleForm(request.POST, instance=profile)
         if form.is_valid():
             form.save()
+            # Profile's post_save does this too; the new role must apply at once
+            roles.invalidate(user.pk)
             return redirect('user_list')
     else:
-        form = UserRoleForm(instance=user.profile)
+        form = UserRoleForm(instance=profile)
     return render(request, 'user_edit_role.html', {'form': form, 'user': user})
 
 from django.contrib.auth.decorators import login_required
@@ -153,37 +166,44 @@ from .forms import InvoiceForm, InvoiceItemFormSet
 from django.forms import formset_factory
 from mongoengine.errors import DoesNotExist
 
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from mongoengine.queryset.visitor import Q
+from django.http import HttpResponse
+from . import rendering, search
+from .filters import filter_documents, filter_query
+from .pagination import KeysetPaginator, InvalidCursor
+
+# Rows per page on the invoice and purchase order lists
+LIST_PAGE_SIZE = 10
+
+def ensure_list_totals(invoices):
+    """Compute totals for listed invoices saved before the current totals version.
+
+    The lists load invoices without their items, so those still waiting for
+    recompute_invoice_totals would show the old (or no) stored totals; their
+    items are fetched with one query, which a backfilled database never makes.
+    """
+    stale = {invoice.pk: invoice for invoice in invoices if invoice.totals_stale}
+    if stale:
+        for found in mongo.for_reads(Invoice.objects(pk__in=list(stale)).only('items')):
+            stale[found.pk].items = found.items
+            stale[found.pk].ensure_totals()
+    return invoices
+
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
 def invoice_list(request):
-    invoices_list = Invoice.objects.all()
-
-    # Search and filter
-    query = request.GET.get('q')
-    if query:
-        vendor_ids = [vendor.id for vendor in Vendor.objects.filter(name__icontains=query)]
-        invoices_list = invoices_list.filter(
-            Q(invoice_number__icontains=query) | Q(vendor__in=vendor_ids)
-        )
-
-    # Pagination
-    paginator = Paginator(invoices_list, 10) # 10 invoices per page
-    page = request.GET.get('page')
+    # Totals are stored on the document, so the line items never need to leave Mongo here
+    invoices_list, filtered = filter_documents(mongo.for_reads(Invoice.objects.exclude('items')), 'invoice_date', request.GET)
+
+    # Keyset pagination on (invoice_date, _id); the count is only estimated for unfiltered lists
+    paginator = KeysetPaginator(invoices_list, 'invoice_date', per_page=LIST_PAGE_SIZE, approximate_count=not filtered)
     try:
-        invoices = paginator.page(page)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page.
-        invoices = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range (e.g. 9999), deliver last page of results.
-        invoices = paginator.page(paginator.num_pages)
+        invoices = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        invoices = paginator.page()
+    invoices.object_list = ensure_list_totals(prefetch_vendors(invoices.object_list))
 
-    return render(request, 'invoice_list.html', {'invoices': invoices})
+    return render(request, 'invoice_list.html', {'invoices': invoices, 'filter_query': filter_query(request.GET)})
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
 def invoice_detail(request, pk):
     try:
@@ -191,9 +211,8 @@ def invoice_detail(request, pk):
         client = Client.load()
     except DoesNotExist:
         return redirect('invoice_list') # Or render a 404 page
-    return render(request, 'invoice_detail.html', {'invoice': invoice, 'client': client})
+    return HttpResponse(rendering.render_invoice('invoice_detail.html', invoice, client))
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager'])
 def invoice_create(request):
     if request.method == 'POST':
@@ -230,7 +249,6 @@ def invoice_create(request):
         formset = InvoiceItemFormSet()
     return render(request, 'invoice_form.html', {'invoice_form': invoice_form, 'formset': formset})
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager'])
 def invoice_update(request, pk):
     try:
@@ -288,7 +306,6 @@ def invoice_update(request, pk):
 
     return render(request, 'invoice_form.html', {'invoice_form': invoice_form, 'formset': formset, 'invoice': invoice})
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager'])
 def invoice_delete(request, pk):
     try:
@@ -301,13 +318,12 @@ def invoice_delete(request, pk):
         return redirect('invoice_list')
     return render(request, 'invoice_confirm_delete.html', {'invoice': invoice})
 
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.template.loader import render_to_string
-import zipfile
+from django.conf import settings
+from .exports import stream_zip, invoice_export_entries, enqueue_export, LOGO_EMBED, LOGO_SHARED
 import os
-from io import BytesIO
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
 def invoice_print_preview(request, pk):
     try:
@@ -315,39 +331,30 @@ def invoice_print_preview(request, pk):
         client = Client.load() # Assuming there's only one client or a way to determine the client
     except DoesNotExist:
         return redirect('invoice_list')
-    return render(request, 'invoice_print.html', {'invoice': invoice, 'client': client})
+    return HttpResponse(rendering.render_invoice('invoice_print.html', invoice, client, Client.load_logo_data_uri()))
+
+def _export_ids(request, document, date_field, field):
+    # The ticked rows, or every document the list's filters match, across pages
+    if request.POST.get('all_matching'):
+        documents, _ = filter_documents(mongo.for_reads(document.objects.all()), date_field, request.POST)
+        return [str(pk) for pk in documents.order_by(f'-{date_field}', '-id').scalar('id')]
+    return request.POST.getlist(field)
+
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
 def invoice_bulk_download(request):
     if request.method == 'POST':
-        invoice_ids = request.POST.getlist('invoice_ids')
+        invoice_ids = _export_ids(request, Invoice, 'invoice_date', 'invoice_ids')
         if not invoice_ids:
             return redirect('invoice_list')
 
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w') as zf:
-            for invoice_id in invoice_ids:
-                try:
-                    invoice = Invoice.objects.get(pk=invoice_id)
-                    client = Client.load()
-                    
-                    logo_data = None
-                    if client.logo and client.logo.grid_id:
-                        logo_data = base64.b64encode(client.logo.read()).decode('utf-8')
-
-                    # Render invoice to HTML
-                    html_content = render_to_string('invoice_print.html', {'invoice': invoice, 'client': client, 'logo_data': logo_data})
-                    
-                    # Add to zip file
-                    filename = f"invoice_{invoice.invoice_number.replace('/', '_')}.html"
-                    zf.writestr(filename, html_content)
-
-                except DoesNotExist:
-                    # Skip if invoice not found
-                    continue
-        
-        response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
+        logo_mode = LOGO_EMBED if request.POST.get('embed_logo') else LOGO_SHARED
+        if len(invoice_ids) > settings.EXPORT_SYNC_LIMIT:
+            job = enqueue_export('invoices', invoice_ids, request.user, logo_mode=logo_mode)
+            return redirect('export_status', pk=job.pk)
+
+        entries = invoice_export_entries(invoice_ids, Client.load(), logo_mode)
+        response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
         response['Content-Disposition'] = 'attachment; filename="invoices.zip"'
         return response
     return redirect('invoice_list')
@@ -355,47 +362,73 @@ def invoice_bulk_download(request):
 
 
 from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from .http import ranged_file_response
 
 def vendor_logo(request, pk):
-    vendor = Vendor.objects.get(pk=pk)
-    try:
-        if vendor.logo and vendor.logo.grid_id:
-            return HttpResponse(vendor.logo.read(), content_type=vendor.logo.content_type)
-    except AttributeError:
-        pass  # Fall through to generating a logo
-
-    # Generate a logo
-    name = vendor.name
-    initials = ''.join([s[0] for s in name.split()]).upper()
-    
-    # Create a circular image
-    img = Image.new('RGBA', (100, 100), (255, 255, 255, 0))
-    draw = ImageDraw.Draw(img)
-    
-    # Draw a circle
-    draw.ellipse((0, 0, 100, 100), fill=(73, 109, 137), outline=None)
-    
-    # Add text
+    vendor = Vendor.objects.only('name', 'logo').get(pk=pk)
+    if vendor.logo and vendor.logo.grid_id:
+        response = uploaded_logo_response(request, vendor)
+        if response is not None:
+            return response
+    return generated_logo_response(request, vendor.initials)
+
+
+def uploaded_logo_response(request, vendor):
+    grid_out = None
+    if 'size' in request.GET:
+        grid_out = logos.thumbnail_file(vendor.logo, _logo_size(request))
+    if grid_out is None:
+        # No size asked for, or the upload can't be resized
+        grid_out = vendor.logo.get()
+    if grid_out is None:
+        return None
+    return _gridfs_response(request, grid_out)
+
+
+def generated_logo_response(request, initials):
+    # Generated logos are cached (memory, then disk) and validated by ETag
+    size = _logo_size(request)
+    style = request.GET.get('style') if request.GET.get('style') in logos.STYLES else logos.DEFAULT_STYLE
+    etag = logos.logo_etag(initials, size, style)
+    response = get_conditional_response(request, etag=etag, last_modified=logos.LOGO_STYLE_DATE)
+    if response is None:
+        response = HttpResponse(logos.render_initials_logo(initials, size, style), content_type='image/png')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(logos.LOGO_STYLE_DATE)
+    patch_cache_control(response, public=True, max_age=3600)
+    return response
+
+
+def _gridfs_response(request, grid_out):
+    # Validated by the file's md5 / upload date; the body is streamed from
+    # GridFS in chunks (with Range support) rather than read into memory.
+    etag = logos.gridfs_etag(grid_out)
+    last_modified = logos.gridfs_last_modified(grid_out)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = ranged_file_response(request, grid_out, grid_out.length, grid_out.content_type or 'application/octet-stream')
+    else:
+        grid_out.close()
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=300)
+    return response
+
+
+def _logo_size(request):
     try:
-        font = ImageFont.truetype("arial.ttf", 40)
-    except IOError:
-        font = ImageFont.load_default()
-    
-    # Center the text
-    text_width = font.getlength(initials)
-    position = ((100 - text_width) / 2, 25)
-    draw.text(position, initials, fill=(255, 255, 0), font=font)
-    
-    # Save to buffer
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    return HttpResponse(buffer.getvalue(), content_type='image/png')
+        size = int(request.GET.get('size', logos.DEFAULT_LOGO_SIZE))
+    except ValueError:
+        return logos.DEFAULT_LOGO_SIZE
+    return size if size in logos.LOGO_SIZES else logos.DEFAULT_LOGO_SIZE
 
 from .forms import ProfileForm
 
 @login_required
 def profile(request):
-    profile = request.user.profile
+    profile = ensure_profile(request.user)
     if request.method == 'POST':
         form = ProfileForm(request.POST, request.FILES, instance=profile)
         if form.is_valid():
@@ -409,32 +442,22 @@ def profile(request):
 # --- Purchase Order Views ---
 from .models import PurchaseOrder, PurchaseOrderItem
 from .forms import PurchaseOrderForm, PurchaseOrderItemFormSet
-# from weasyprint import HTML
+from .exports import po_export_entries
+from .pdf import get_engine as get_pdf_engine, RenderTimeout
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
 def po_list(request):
-    po_list = PurchaseOrder.objects.order_by('-po_date')
+    po_list, filtered = filter_documents(mongo.for_reads(PurchaseOrder.objects.all()), 'po_date', request.GET)
 
-    query = request.GET.get('q')
-    if query:
-        vendor_ids = [vendor.id for vendor in Vendor.objects.filter(name__icontains=query)]
-        po_list = po_list.filter(
-            Q(po_number__icontains=query) | Q(vendor__in=vendor_ids)
-        )
-
-    paginator = Paginator(po_list, 10)
-    page = request.GET.get('page')
+    paginator = KeysetPaginator(po_list, 'po_date', per_page=LIST_PAGE_SIZE, approximate_count=not filtered)
     try:
-        purchase_orders = paginator.page(page)
-    except PageNotAnInteger:
-        purchase_orders = paginator.page(1)
-    except EmptyPage:
-        purchase_orders = paginator.page(paginator.num_pages)
+        purchase_orders = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        purchase_orders = paginator.page()
+    purchase_orders.object_list = prefetch_vendors(purchase_orders.object_list)
 
-    return render(request, 'po_list.html', {'purchase_orders': purchase_orders})
+    return render(request, 'po_list.html', {'purchase_orders': purchase_orders, 'filter_query': filter_query(request.GET)})
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
 def po_detail(request, pk):
     try:
@@ -442,9 +465,8 @@ def po_detail(request, pk):
         client = Client.load()
     except DoesNotExist:
         return redirect('po_list')
-    return render(request, 'po_detail.html', {'po': po, 'client': client})
+    return render(request, 'po_detail.html', {'po': po, 'client': client, 'logo_src': Client.load_logo_data_uri()})
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager'])
 def po_create(request):
     if request.method == 'POST':
@@ -457,6 +479,7 @@ def po_create(request):
                 vendor=vendor,
                 po_date=po_form.cleaned_data['po_date'],
                 terms=po_form.cleaned_data['terms'],
+                status=po_form.cleaned_data['status'],
             )
             if po_form.cleaned_data.get('po_number'):
                 po.po_number = po_form.cleaned_data['po_number']
@@ -474,7 +497,6 @@ def po_create(request):
         formset = PurchaseOrderItemFormSet()
     return render(request, 'po_form.html', {'po_form': po_form, 'formset': formset})
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager'])
 def po_update(request, pk):
     try:
@@ -490,6 +512,7 @@ def po_update(request, pk):
             po.vendor = Vendor.objects.get(pk=vendor_id)
             po.po_date = po_form.cleaned_data['po_date']
             po.terms = po_form.cleaned_data['terms']
+            po.status = po_form.cleaned_data['status']
             po.po_number = po_form.cleaned_data['po_number']
 
             items = []
@@ -505,6 +528,7 @@ def po_update(request, pk):
             'vendor': str(po.vendor.id),
             'po_date': po.po_date.strftime('%Y-%m-%d'),
             'terms': po.terms,
+            'status': po.status,
             'po_number': po.po_number,
         }
         po_form = PurchaseOrderForm(initial=initial_po_data)
@@ -513,7 +537,6 @@ def po_update(request, pk):
 
     return render(request, 'po_form.html', {'po_form': po_form, 'formset': formset, 'po': po})
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager'])
 def po_delete(request, pk):
     try:
@@ -526,37 +549,169 @@ def po_delete(request, pk):
         return redirect('po_list')
     return render(request, 'po_confirm_delete.html', {'po': po})
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
 def po_download(request, pk):
-    po = get_object_or_404(PurchaseOrder, pk=pk)
+    try:
+        po = PurchaseOrder.objects.get(pk=pk)
+    except DoesNotExist:
+        return redirect('po_list')
     client = Client.load()
-    html_string = render_to_string('po_detail.html', {'po': po, 'client': client})
-    pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-    
+    html_string = render_to_string('po_detail.html', {'po': po, 'client': client, 'logo_src': Client.load_logo_data_uri()})
+    try:
+        pdf_file = get_pdf_engine().render(html_string, base_url=request.build_absolute_uri())
+    except RenderTimeout:
+        return HttpResponse("Generating the PDF took too long. Please try again.", status=504)
+
     response = HttpResponse(pdf_file, content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="PO_{po.po_number}.pdf"'
     return response
 
-@login_required
 @roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
 def po_bulk_download(request):
     if request.method == 'POST':
-        po_ids = request.POST.getlist('po_ids')
+        po_ids = _export_ids(request, PurchaseOrder, 'po_date', 'po_ids')
         if not po_ids:
             return redirect('po_list')
 
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for po_id in po_ids:
-                po = get_object_or_404(PurchaseOrder, pk=po_id)
-                client = Client.load()
-                html_string = render_to_string('po_detail.html', {'po': po, 'client': client})
-                pdf_file = HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf()
-                filename = f"PO_{po.po_number.replace('/', '-')}.pdf"
-                zf.writestr(filename, pdf_file)
-        
-        response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
+        if len(po_ids) > settings.EXPORT_SYNC_LIMIT:
+            job = enqueue_export('purchase_orders', po_ids, request.user, base_url=request.build_absolute_uri())
+            return redirect('export_status', pk=job.pk)
+
+        entries = po_export_entries(po_ids, Client.load(), base_url=request.build_absolute_uri())
+        response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
         response['Content-Disposition'] = 'attachment; filename="purchase_orders.zip"'
         return response
     return redirect('po_list')
+
+
+# --- Export Job Views ---
+from django.http import JsonResponse, Http404
+from .models import ExportJob
+from .exports import export_path
+
+
+def _get_export_job(request, pk):
+    try:
+        job = ExportJob.objects.get(pk=pk)
+    except DoesNotExist:
+        raise Http404("Export not found")
+    if job.user_id != request.user.id and not roles.permissions(request)['admin']:
+        raise Http404("Export not found")
+    return job
+
+
+@roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
+def export_status(request, pk):
+    job = _get_export_job(request, pk)
+    return render(request, 'export_status.html', {'job': job})
+
+
+@roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
+def export_status_json(request, pk):
+    job = _get_export_job(request, pk)
+    return JsonResponse({
+        'status': job.status,
+        'processed': job.processed,
+        'total': job.total,
+        'progress': job.progress,
+        'error': job.error,
+        'download_url': reverse('export_download', args=[job.pk]) if job.status == 'done' else None,
+    })
+
+
+@roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
+def export_download(request, pk):
+    job = _get_export_job(request, pk)
+    path = export_path(job)
+    if job.status != 'done' or not path.exists():
+        raise Http404("Export is not ready")
+    return ranged_file_response(request, open(path, 'rb'), path.stat().st_size, 'application/zip', filename=job.filename)
+
+
+# --- Report Views ---
+from .forms import ReportFilterForm
+from . import reports
+
+
+def _report_rows(request):
+    form = ReportFilterForm(request.GET or None)
+    filters = form.cleaned_data if form.is_valid() else {}
+    period = filters.get('period') or 'month'
+    rows = reports.revenue_by_vendor(period, filters.get('start'), filters.get('end'))
+    return form, period, rows
+
+
+@roles_required(allowed_roles=['admin', 'accountant'])
+def report_revenue(request):
+    form, period, rows = _report_rows(request)
+    return render(request, 'reports.html', {'form': form, 'period': period, 'rows': rows, 'summary': reports.summarize(rows)})
+
+
+@roles_required(allowed_roles=['admin', 'accountant'])
+def report_revenue_json(request):
+    form, period, rows = _report_rows(request)
+    if form.is_bound and not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    return JsonResponse({'period': period, 'rows': rows, 'summary': reports.summarize(rows)})
+
+
+# --- Invoice Import ---
+from .forms import InvoiceImportForm
+from . import importers
+
+# Errors listed on the import page; the command reports all of them
+IMPORT_ERRORS_SHOWN = 100
+
+
+@roles_required(allowed_roles=['admin', 'project_manager'])
+def invoice_import(request):
+    result = None
+    if request.method == 'POST':
+        form = InvoiceImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            stream = importers.open_text(upload.file)
+            result = importers.import_invoices(
+                stream, importers.detect_format(upload.name), dry_run=form.cleaned_data['dry_run'],
+            )
+    else:
+        form = InvoiceImportForm()
+    return render(request, 'invoice_import.html', {
+        'form': form,
+        'result': result,
+        'errors': result.errors[:IMPORT_ERRORS_SHOWN] if result else [],
+    })
+
+
+# --- Ledger Exports ---
+from django.utils import timezone
+from . import ledgers
+
+
+def _ledger_response(chunks, name):
+    response = StreamingHttpResponse(chunks, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{name}-ledger-{timezone.now():%Y%m%d}.csv"'
+    return response
+
+
+@roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
+def invoice_ledger(request):
+    invoices, _ = filter_documents(mongo.for_reads(Invoice.objects.all()), 'invoice_date', request.GET)
+    return _ledger_response(ledgers.invoice_ledger(invoices), 'invoice')
+
+
+@roles_required(allowed_roles=['admin', 'project_manager', 'accountant'])
+def po_ledger(request):
+    purchase_orders, _ = filter_documents(mongo.for_reads(PurchaseOrder.objects.all()), 'po_date', request.GET)
+    return _ledger_response(ledgers.po_ledger(purchase_orders), 'po')
+
+
+# --- Monitoring ---
+@roles_required(allowed_roles=['admin'])
+def mongo_pools(request):
+    return JsonResponse({
+        'max_pool_size': settings.MONGODB_MAX_POOL_SIZE,
+        'min_pool_size': settings.MONGODB_MIN_POOL_SIZE,
+        'wait_queue_timeout_ms': settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        'pools': mongo.pool_snapshot(),
+    })
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the session and auth queries are counted too
+    'invoice.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,11 +63,16 @@ TEMPLATES = [
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
+        # No 'loaders' option, so Django wraps these loaders in the cached
+        # loader: templates are compiled once per process (and recompiled
+        # when a file changes while DEBUG is on). Setting 'loaders' would
+        # turn that off unless it lists django.template.loaders.cached.Loader.
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'invoice.context_processors.user_role',
             ],
         },
     },
@@ -84,6 +92,18 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Point this at a shared backend (Redis, Memcached) in production so cache
+# invalidations, e.g. of the client settings, reach every worker process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -132,6 +152,81 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
-import mongoengine
+# Search backend for the invoice and PO lists: 'keys' matches the indexed
+# prefix keys stored on each document, 'text' uses a MongoDB $text index.
+INVOICE_SEARCH_BACKEND = 'keys'
+
+# PDF rendering for purchase orders. The backend is any class with a
+# render(html, base_url) method; documents are converted on a pool of
+# INVOICE_PDF_WORKERS processes (0 renders inline), each with a timeout.
+INVOICE_PDF_BACKEND = 'invoice.pdf.WeasyPrintBackend'
+INVOICE_PDF_WORKERS = 4
+INVOICE_PDF_TIMEOUT = 60
+
+# Bulk downloads of more documents than this are queued as export jobs and
+# built by `manage.py run_export_worker` instead of inside the request. The
+# lists' "Download all matching" button selects across pages, so a download
+# from the UI can go over it.
+EXPORT_SYNC_LIMIT = 25
+# Seconds a running export job may go without reporting progress before the
+# worker is presumed dead and the job is queued again (up to
+# EXPORT_JOB_MAX_ATTEMPTS tries). Progress is written every 10 documents, so
+# keep this above ten PDF renders (INVOICE_PDF_TIMEOUT).
+EXPORT_JOB_STALE_AFTER = 15 * 60
+EXPORT_JOB_MAX_ATTEMPTS = 3
+# Seconds finished export archives are kept under MEDIA_ROOT/exports/
+EXPORT_FILE_TTL = 7 * 24 * 60 * 60
+
+# Per-request Mongo/SQL query counts (invoice.middleware). Every request is
+# logged to "invoice.queries"; these also send the totals as a Server-Timing
+# header and show them in a panel on each HTML page.
+INVOICE_SERVER_TIMING = DEBUG
+INVOICE_QUERY_PANEL = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'invoice.queries': {
+            'handlers': ['console'],
+            'level': os.environ.get('INVOICE_QUERY_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
 
-mongoengine.connect(db="vendor_invoice_db", host="localhost", port=27017)
+# Seconds a user's role stays cached for roles_required. Role changes clear
+# the entry straight away, but only in the process's own cache when CACHES
+# is local memory, so other workers can lag by up to this long.
+INVOICE_ROLE_CACHE_TIMEOUT = 300
+
+# Seconds rendered invoice pages (detail, print preview, exported HTML) stay
+# cached. Entries are keyed on the invoice, vendor and client settings
+# versions, so edits show up at once; this only bounds how long superseded
+# entries linger. See invoice/rendering.py.
+INVOICE_RENDER_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Serve the read-heavy views (invoice/PO lists and details, vendor logos)
+# with their async versions. Turn on when running under an ASGI server.
+INVOICE_ASYNC_VIEWS = os.environ.get('INVOICE_ASYNC_VIEWS') == '1'
+
+# MongoDB, overridable from the environment. MONGODB_HOST may also be a full
+# mongodb:// URI (e.g. a replica set). Connections are registered by the
+# invoice app and opened on first use; see invoice/mongo.py.
+MONGODB_NAME = os.environ.get('MONGODB_NAME', "vendor_invoice_db")
+MONGODB_HOST = os.environ.get('MONGODB_HOST', "localhost")
+MONGODB_PORT = int(os.environ.get('MONGODB_PORT', 27017))
+
+# Per-client connection pool. Requests wait up to MONGODB_WAIT_QUEUE_TIMEOUT_MS
+# for a free connection before failing instead of queueing indefinitely.
+MONGODB_MAX_POOL_SIZE = int(os.environ.get('MONGODB_MAX_POOL_SIZE', 100))
+MONGODB_MIN_POOL_SIZE = int(os.environ.get('MONGODB_MIN_POOL_SIZE', 0))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 5000))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000))
+
+# Wire compression, e.g. "zstd,zlib" (zstd and snappy need their Python
+# packages installed). Off by default; worth it when the database is remote.
+MONGODB_COMPRESSORS = os.environ.get('MONGODB_COMPRESSORS', '')